@@ -0,0 +1,508 @@
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+from .transport import Transport, TransportError
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+
+class AssetUnavailableError(RuntimeError):
+    pass
+
+
+class AssetFetchCancelled(RuntimeError):
+    pass
+
+
+class FileLock:
+    """Exclusive advisory lock on ``path`` between processes, not reentrant."""
+
+    POLL_INTERVAL = 0.05
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    def _try_lock(self, fd):
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        except OSError:
+            return False
+        return True
+
+    def acquire(self, cancel=None):
+        """Wait for the lock, returns False if the ``cancel`` event got set meanwhile."""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        while not self._try_lock(fd):
+            if cancel is not None and cancel.is_set():
+                os.close(fd)
+                return False
+            time.sleep(self.POLL_INTERVAL)
+        self._fd = fd
+        return True
+
+    def release(self):
+        # NOTE: the file stays, removing it would let a waiting process lock a stale inode
+        fd, self._fd = self._fd, None
+        if fcntl is None:
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        os.close(fd)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class AssetCache:
+    """Content-addressed on-disk cache for remote assets.
+
+    Blobs live under ``objects/<sha256[:2]>/<sha256><ext>`` and ``index.json``
+    maps each URL to its blob plus the ETag/Last-Modified seen on download,
+    or to ``{"missing": time}`` when the server said it has no such file.
+    Transfers are streamed into ``partial/`` and renamed into place when done.
+
+    Several processes may share ``root``: the index is re-read and written
+    under ``index.json.lock``, and a URL is downloaded by one process at a time.
+    """
+
+    INDEX_FILENAME = "index.json"
+    CHUNK_SIZE = 256 * 1024
+    # S3 answers 403 for a missing key when listing is not allowed
+    MISSING_STATUSES = (403, 404)
+
+    def __init__(self, root, max_bytes=1024 * 1024 * 1024, max_age=3600.0, offline=False, transport=None):
+        self.root = root
+        self.max_bytes = max_bytes
+        # NOTE: seconds after a validation during which the network is not touched
+        self.max_age = max_age
+        self.offline = offline
+        self.transport = transport or Transport()
+
+        self._lock = threading.RLock()
+        self._index = None
+        # Identity of the index file last read or written, to notice other processes' writes
+        self._index_stamp = None
+        # NOTE: one download per URL at a time, other callers wait for it
+        self._url_locks = {}
+
+    # index
+
+    def _index_path(self):
+        return os.path.join(self.root, self.INDEX_FILENAME)
+
+    def _index_file_stamp(self):
+        try:
+            stat = os.stat(self._index_path())
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _load_index(self):
+        stamp = self._index_file_stamp()
+        if self._index is None or stamp != self._index_stamp:
+            try:
+                with open(self._index_path(), "r", encoding="utf-8") as f:
+                    self._index = json.load(f)
+            except (OSError, ValueError):
+                self._index = {}
+            self._index_stamp = stamp
+        return self._index
+
+    def _save_index(self):
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = f"{self._index_path()}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._index, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self._index_path())
+        self._index_stamp = self._index_file_stamp()
+
+    @contextlib.contextmanager
+    def _update_index(self):
+        # Read-modify-write of the index, yields the index as it is on disk now
+        with self._lock, FileLock(self._index_path() + ".lock"):
+            index = self._load_index()
+            yield index
+            self._save_index()
+
+    def _blob_path(self, sha256, ext):
+        return os.path.join(self.root, "objects", sha256[:2], sha256 + ext)
+
+    def _entry_path(self, entry):
+        return self._blob_path(entry["sha256"], entry.get("ext", ""))
+
+    # public
+
+    def lookup(self, url):
+        """Return the cached file for ``url`` without touching the network."""
+        with self._lock:
+            entry = self._load_index().get(url)
+            if entry is None or "missing" in entry:
+                return None
+            path = self._entry_path(entry)
+            if not os.path.exists(path):
+                with self._update_index() as index:
+                    if index.get(url) == entry:
+                        del index[url]
+                return None
+            return path
+
+    def fresh_lookup(self, url):
+        """Return the cached file for ``url`` if it can be used without revalidation."""
+        with self._lock:
+            path = self.lookup(url)
+            if path is None:
+                return None
+            entry = self._index[url]
+            if self.offline or time.time() - entry.get("validated", 0.0) < self.max_age:
+                self._touch(url)
+                return path
+            return None
+
+    def fetch(self, url, progress=None, cancel=None):
+        """Return a local path for ``url``, downloading or revalidating as needed.
+
+        ``progress(done, total)`` is called per chunk; ``total`` is None when the
+        server does not send a length. Setting the ``cancel`` event stops the
+        transfer with AssetFetchCancelled. Interrupted transfers resume next time.
+        """
+        with self._lock:
+            url_lock = self._url_locks.setdefault(url, threading.Lock())
+
+        with url_lock:
+            path = self.fresh_lookup(url)
+            if path is not None:
+                return path
+            # NOTE: other processes sharing the cache wait here while one of them downloads the URL
+            partial_lock = FileLock(self._partial_path(url) + ".lock")
+            if not partial_lock.acquire(cancel):
+                raise AssetFetchCancelled(f"Download of {url} cancelled")
+            try:
+                return self._fetch(url, progress, cancel)
+            finally:
+                partial_lock.release()
+
+    def _fetch(self, url, progress, cancel):
+        with self._lock:
+            path = self.fresh_lookup(url)
+            if path is not None:
+                return path
+            path = self.lookup(url)
+            entry = self._index.get(url)
+            if path is None and self.offline:
+                raise AssetUnavailableError(f"Offline mode and no cached copy of {url}")
+            if path is None and entry is not None and time.time() - entry["missing"] < self.max_age:
+                raise AssetUnavailableError(f"{url} does not exist")
+
+        partial_path = self._partial_path(url)
+        resumes = self.transport.retries
+        while True:
+            partial_size = os.path.getsize(partial_path) if os.path.exists(partial_path) else 0
+            try:
+                return self._download(url, entry if path is not None else None, progress, cancel)
+            except OSError as e:
+                error = e
+            if getattr(error, "status", None) in self.MISSING_STATUSES:
+                if path is None:
+                    with self._update_index() as index:
+                        index[url] = {"missing": time.time()}
+                break
+            # Resume where the link dropped as long as every attempt makes progress
+            grew = os.path.exists(partial_path) and os.path.getsize(partial_path) > partial_size
+            if not grew or resumes <= 0:
+                break
+            resumes -= 1
+
+        if path is not None:
+            # NOTE: serve the stale copy rather than fail when the link is down
+            self._touch(url)
+            return path
+        raise AssetUnavailableError(f"Can not download {url}: {error}") from error
+
+    def clear(self):
+        with self._update_index() as index:
+            # NOTE: the whole directory goes, blobs a lost index write left behind included
+            shutil.rmtree(os.path.join(self.root, "objects"), ignore_errors=True)
+            index.clear()
+
+    def total_size(self):
+        with self._lock:
+            blobs = {(e["sha256"], e.get("ext", "")): e["size"]
+                     for e in self._load_index().values() if "missing" not in e}
+            return sum(blobs.values())
+
+    # internals
+
+    def _touch(self, url):
+        with self._update_index() as index:
+            entry = index.get(url)
+            if entry is not None and "missing" not in entry:
+                entry["atime"] = time.time()
+
+    def _partial_path(self, url):
+        return os.path.join(self.root, "partial", hashlib.sha256(url.encode("utf-8")).hexdigest() + ".part")
+
+    def _download(self, url, entry, progress=None, cancel=None):
+        partial_path = self._partial_path(url)
+        partial_meta_path = partial_path + ".json"
+        os.makedirs(os.path.dirname(partial_path), exist_ok=True)
+
+        headers = {}
+        partial_size = os.path.getsize(partial_path) if os.path.exists(partial_path) else 0
+        partial_meta = {}
+        if partial_size:
+            try:
+                with open(partial_meta_path, "r", encoding="utf-8") as f:
+                    partial_meta = json.load(f)
+            except (OSError, ValueError):
+                partial_size = 0
+
+        validator = partial_meta.get("etag") or partial_meta.get("last_modified")
+        if partial_size and validator:
+            # NOTE: If-Range makes the server send the whole file if it changed meanwhile
+            headers["Range"] = f"bytes={partial_size}-"
+            headers["If-Range"] = validator
+        else:
+            partial_size = 0
+            if entry is not None:
+                if entry.get("etag"):
+                    headers["If-None-Match"] = entry["etag"]
+                if entry.get("last_modified"):
+                    headers["If-Modified-Since"] = entry["last_modified"]
+
+        with self.transport.request("GET", url, headers) as response:
+            if response.status == 304 and entry is not None:
+                response.read()
+                with self._update_index() as index:
+                    current = index.get(url)
+                    if current is not None and current.get("sha256") == entry["sha256"]:
+                        current["validated"] = current["atime"] = time.time()
+                return self._entry_path(entry)
+
+            if response.status == 416 and os.path.exists(partial_path):
+                os.remove(partial_path)
+            if response.status not in (200, 206):
+                raise TransportError(f"GET {url} returned {response.status}", response.status)
+
+            response_headers = response.headers
+            digest = hashlib.sha256()
+
+            if response.status == 206:
+                with open(partial_path, "rb") as f:
+                    for chunk in iter(lambda: f.read(self.CHUNK_SIZE), b""):
+                        digest.update(chunk)
+                mode = "ab"
+            else:
+                partial_size = 0
+                mode = "wb"
+                with open(partial_meta_path, "w", encoding="utf-8") as f:
+                    json.dump({
+                        "etag": response_headers.get("ETag"),
+                        "last_modified": response_headers.get("Last-Modified"),
+                    }, f)
+
+            length = response_headers.get("Content-Length")
+            total = partial_size + int(length) if length is not None else None
+            done = partial_size
+
+            with open(partial_path, mode) as out_file:
+                while True:
+                    if cancel is not None and cancel.is_set():
+                        raise AssetFetchCancelled(f"Download of {url} cancelled")
+                    chunk = response.read(self.CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    out_file.write(chunk)
+                    digest.update(chunk)
+                    done += len(chunk)
+                    if progress is not None:
+                        progress(done, total)
+
+        if total is not None and done != total:
+            raise TransportError(f"Incomplete download of {url}: {done}/{total} bytes")
+
+        sha256 = digest.hexdigest()
+        ext = os.path.splitext(urllib.parse.urlsplit(url).path)[1]
+        blob_path = self._blob_path(sha256, ext)
+
+        with self._update_index() as index:
+            if os.path.exists(blob_path):
+                os.remove(partial_path)
+            else:
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                os.replace(partial_path, blob_path)
+            try:
+                os.remove(partial_meta_path)
+            except OSError:
+                pass
+
+            now = time.time()
+            index[url] = {
+                "sha256": sha256,
+                "ext": ext,
+                "size": done,
+                "etag": response_headers.get("ETag"),
+                "last_modified": response_headers.get("Last-Modified"),
+                "validated": now,
+                "atime": now,
+            }
+            self._evict(keep=url)
+
+        return blob_path
+
+    def _evict(self, keep=None):
+        # LRU over blobs; a blob may be shared by several URLs with identical content
+        if self.max_bytes <= 0:
+            return
+
+        blobs = {}
+        for url, entry in self._index.items():
+            if "missing" in entry:
+                continue
+            key = (entry["sha256"], entry.get("ext", ""))
+            size, atime, urls = blobs.get(key, (entry["size"], 0.0, []))
+            blobs[key] = (size, max(atime, entry.get("atime", 0.0)), urls + [url])
+
+        total = sum(size for size, _, _ in blobs.values())
+        for key, (size, _, urls) in sorted(blobs.items(), key=lambda item: item[1][1]):
+            if total <= self.max_bytes:
+                break
+            if keep in urls:
+                continue
+            for url in urls:
+                del self._index[url]
+            try:
+                os.remove(self._blob_path(*key))
+            except OSError:
+                pass
+            total -= size
+
+
+class AssetFetchJob:
+    """Runs AssetCache.fetch on a worker thread so the caller can poll it.
+
+    Each URL is tried in turn until one of them is available.
+    """
+
+    def __init__(self, cache, *urls):
+        self.cache = cache
+        self.urls = urls
+        self.url = urls[0]
+        self.name = os.path.basename(urllib.parse.urlsplit(self.url).path)
+
+        self.done = 0
+        self.total = None
+        self.path = None
+        self.error = None
+
+        self._cancel = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"fetch {self.name}", daemon=True)
+
+    @property
+    def finished(self):
+        return not self._thread.is_alive() and (self.path is not None or self.error is not None)
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    @property
+    def fraction(self):
+        if not self.total:
+            return 0.0
+        return min(self.done / self.total, 1.0)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def cancel(self):
+        self._cancel.set()
+
+    def _progress(self, done, total):
+        self.done = done
+        self.total = total
+
+    def _run(self):
+        fresh = fresh_lookup_first(self.cache, self.urls)
+        if fresh is not None:
+            self.url, self.path = fresh
+            self.name = os.path.basename(urllib.parse.urlsplit(self.url).path)
+            return
+
+        for url in self.urls:
+            self.url = url
+            self.name = os.path.basename(urllib.parse.urlsplit(url).path)
+            try:
+                self.path = self.cache.fetch(url, progress=self._progress, cancel=self._cancel)
+                self.error = None
+                return
+            except AssetUnavailableError as e:
+                self.error = e
+            except Exception as e:  # noqa: BLE001 handed over to the main thread
+                self.error = e
+                return
+
+
+def fresh_lookup_first(cache, urls):
+    """``(url, path)`` of the first of ``urls`` cached fresh enough to skip the network, else None."""
+    for url in urls:
+        path = cache.fresh_lookup(url)
+        if path is not None:
+            return url, path
+    return None
+
+
+def fetch_first(cache, urls):
+    """Fetch the first of ``urls`` that is available.
+
+    A fresh cached copy of any of them is used before going to the network
+    for an earlier one.
+    """
+    fresh = fresh_lookup_first(cache, urls)
+    if fresh is not None:
+        return fresh[1]
+
+    error = None
+    for url in urls:
+        try:
+            return cache.fetch(url)
+        except AssetUnavailableError as e:
+            error = e
+    raise error
+
+
+def prefetch(cache, urls, max_workers=4):
+    """Fetch ``urls`` concurrently, returns ``{url: path or exception}``.
+
+    An item may also be a tuple of alternative URLs, see fetch_first.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch") as pool:
+        futures = {url: pool.submit(fetch_first, cache, url if isinstance(url, tuple) else (url,))
+                   for url in urls}
+
+    results = {}
+    for url, future in futures.items():
+        try:
+            results[url] = future.result()
+        except Exception as e:  # noqa: BLE001 reported per URL
+            results[url] = e
+    return results
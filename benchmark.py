@@ -0,0 +1,397 @@
+"""Timings of the toolbox hot paths on synthetic meshes.
+
+    blender -b --factory-startup -P benchmark.py -- --sizes 1000 100000 --output bench.json
+    blender -b --factory-startup -P benchmark.py -- --baseline bench.json
+    python benchmark.py --compare new.json old.json
+
+The meshes are closed tori of about the requested triangle count. Every
+timing is the median and minimum of ``--repeat`` runs in seconds, keyed by
+``name[triangles]``. With ``--baseline`` the run is compared against an
+earlier output and the exit code is 1 when anything got slower than
+``--threshold``.
+"""
+
+import argparse
+import functools
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+if __package__:
+    from . import headless
+else:
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import headless
+
+
+DEFAULT_SIZES = (1000, 10000, 100000, 1000000, 5000000)
+# NOTE: N keys on the largest meshes need gigabytes for the key data alone
+SHAPE_KEY_MAX_TRIANGLES = 1000000
+ORDER_ID = "A01-0042"
+
+# group name -> benchmark function, see benchmark()
+BENCHMARKS = {}
+
+
+def benchmark(name, sized=True):
+    def decorator(fn):
+        BENCHMARKS[name] = (fn, sized)
+        return fn
+    return decorator
+
+
+def measure(fn, repeat, setup=None, teardown=None):
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+        if teardown is not None:
+            teardown()
+    return {"median": statistics.median(times), "min": min(times), "repeat": repeat}
+
+
+def torus_arrays(triangles, major=100.0, minor=30.0):
+    # Closed quad torus with about ``triangles`` triangles once triangulated
+    import numpy as np
+
+    nv = max(3, int(round((triangles / 4) ** 0.5)))
+    nu = max(3, int(round(triangles / 2 / nv)))
+    u, v = np.meshgrid(np.arange(nu) * (2 * np.pi / nu), np.arange(nv) * (2 * np.pi / nv), indexing="ij")
+    r = major + minor * np.cos(v)
+    co = np.stack([r * np.cos(u), r * np.sin(u), minor * np.sin(v)], axis=-1).reshape(-1, 3)
+
+    i, j = np.meshgrid(np.arange(nu), np.arange(nv), indexing="ij")
+    a = i * nv + j
+    b = (i + 1) % nu * nv + j
+    c = (i + 1) % nu * nv + (j + 1) % nv
+    d = i * nv + (j + 1) % nv
+    vertex_index = np.stack([a, b, c, d], axis=-1).reshape(-1)
+    loop_start = np.arange(nu * nv) * 4
+    return co, vertex_index, loop_start
+
+
+class Bench:
+    """What the benchmark functions share: the add-on modules, scene and options."""
+
+    def __init__(self, scripting, scene, repeat, keys):
+        import bpy
+
+        self.bpy = bpy
+        self.scripting = scripting
+        self.package = sys.modules[scripting.__package__]
+        self.scene = scene
+        self.repeat = repeat
+        self.keys = keys
+
+    def measure(self, fn, setup=None, teardown=None, repeat=None):
+        return measure(fn, repeat or self.repeat, setup, teardown)
+
+    def object_override(self, obj):
+        return self.bpy.context.temp_override(active_object=obj, object=obj, selected_objects=[obj])
+
+    def new_torus(self, triangles):
+        co, vertex_index, loop_start = torus_arrays(triangles)
+        me = self.package.mesh_arrays.mesh_from_arrays(f"bench.{triangles}", co, vertex_index, loop_start)
+        # NOTE: a UV layer like the scans have, it is what the lean copies skip
+        me.uv_layers.new()
+        obj = self.bpy.data.objects.new(me.name, me)
+        self.scene.collection.objects.link(obj)
+        self.scene.view_layers[0].objects.active = obj
+        return obj
+
+    def remove(self, objects):
+        for obj in objects:
+            me = obj.data
+            self.bpy.data.objects.remove(obj)
+            if me is not None and me.users == 0:
+                self.bpy.data.meshes.remove(me)
+
+
+@benchmark("cost")
+def bench_cost(bench, obj):
+    scripting = bench.scripting
+    cost_monitor = bench.scene.cost_monitor
+    results = {}
+
+    for engine in ('NUMPY', 'BMESH'):
+        cost_monitor.volume_engine = engine
+        with bench.object_override(obj):
+            results[f"cost.{engine.lower()}"] = bench.measure(lambda: bench.bpy.ops.object.gen_cost())
+
+    # Support estimate from scratch and from the per mesh state cache
+    cost_monitor.volume_engine = 'NUMPY'
+    cost_monitor.support_enabled = True
+    with bench.object_override(obj):
+        results["cost.supports"] = bench.measure(
+            lambda: bench.bpy.ops.object.gen_cost(), setup=scripting._support_volumes.clear)
+        results["cost.supports_cached"] = bench.measure(lambda: bench.bpy.ops.object.gen_cost())
+    cost_monitor.support_enabled = False
+
+    for lean in (False, True):
+        stats = {}
+
+        def copy():
+            bm = scripting.bmesh_copy_from_object(obj, lean=lean, normal_update=not lean, stats=stats)
+            bm.free()
+
+        timing = bench.measure(copy)
+        timing["peak_bytes"] = stats["peak_bytes"]
+        results["bmesh_copy.lean" if lean else "bmesh_copy.full"] = timing
+    return results
+
+
+@benchmark("selection")
+def bench_selection(bench, obj):
+    import bmesh
+
+    bpy = bench.bpy
+    scripting = bench.scripting
+    results = {}
+
+    me = obj.data
+    me.vertices.foreach_set("select", [True] * len(me.vertices))
+    me.polygons.foreach_set("select", [True] * len(me.polygons))
+
+    with bench.object_override(obj):
+        bpy.ops.object.mode_set(mode='EDIT')
+        try:
+            selection_state = scripting.selection_state
+            results["selection.refresh"] = bench.measure(selection_state.refresh)
+            results["selection.draw"] = bench.measure(lambda: selection_state.get(bpy.context))
+            results["selection.face_frame"] = bench.measure(scripting.get_selected_face_center_and_normal)
+
+            bm = bmesh.from_edit_mesh(me)
+            verts = [v for v in bm.verts if v.select]
+            results["average_normal"] = bench.measure(lambda: scripting.calculate_average_normal(verts))
+        finally:
+            bpy.ops.object.mode_set(mode='OBJECT')
+    return results
+
+
+@benchmark("shape_keys")
+def bench_shape_keys(bench, obj):
+    import numpy as np
+
+    if len(obj.data.polygons) * 2 > SHAPE_KEY_MAX_TRIANGLES:
+        return {}
+
+    base = np.empty(len(obj.data.vertices) * 3, dtype=np.float32)
+    obj.data.vertices.foreach_get("co", base)
+    rng = np.random.default_rng(0)
+
+    # Every other vertex, for keys masked by a vertex group
+    mask = obj.vertex_groups.new(name="bench.mask")
+    mask.add(list(range(0, len(obj.data.vertices), 2)), 0.5, 'REPLACE')
+
+    def add_keys(vertex_group=""):
+        obj.shape_key_clear()
+        obj.data.vertices.foreach_set("co", base)
+        obj.shape_key_add(name="Basis")
+        for i in range(bench.keys):
+            key = obj.shape_key_add(name=f"key.{i}", from_mix=False)
+            key.data.foreach_set("co", base + rng.normal(0.0, 0.1, base.shape).astype(np.float32))
+            key.value = 0.5
+            key.vertex_group = vertex_group
+
+    results = {}
+    with bench.object_override(obj):
+        results[f"apply_shape_keys.{bench.keys}"] = bench.measure(
+            lambda: bench.bpy.ops.object.apply_shape_keys(), setup=add_keys)
+        results[f"apply_shape_keys.{bench.keys}.masked"] = bench.measure(
+            lambda: bench.bpy.ops.object.apply_shape_keys(), setup=lambda: add_keys(mask.name))
+    obj.vertex_groups.remove(mask)
+    obj.data.vertices.foreach_set("co", base)
+    obj.data.update()
+    return results
+
+
+@benchmark("label", sized=False)
+def bench_label(bench):
+    order_labels = bench.package.order_labels
+    collection = bench.scene.collection
+    results = {}
+    created = []
+
+    def teardown():
+        bench.remove(created)
+        created.clear()
+
+    def label(glyphs=None, full_label=False):
+        created.append(order_labels.generate_order_label(collection, ORDER_ID, full_label, glyphs=glyphs))
+
+    results["label.text"] = bench.measure(label, teardown=teardown)
+    results["label.text_full"] = bench.measure(lambda: label(full_label=True), teardown=teardown)
+
+    cold = []
+
+    def fresh_glyphs():
+        cold[:] = [order_labels.GlyphCache()]
+
+    results["label.glyphs_cold"] = bench.measure(lambda: label(cold[0]), setup=fresh_glyphs, teardown=teardown)
+
+    glyphs = order_labels.GlyphCache()
+    glyphs.warm()
+    results["label.glyphs_warm"] = bench.measure(lambda: label(glyphs), teardown=teardown)
+    results["label.glyphs_warm_full"] = bench.measure(lambda: label(glyphs, True), teardown=teardown)
+    return results
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+@benchmark("download")
+def bench_download(bench, obj):
+    # A local stand-in for S3_BUCKET serving the test mesh as .blend and .npz
+    bpy = bench.bpy
+    package = bench.package
+    root = tempfile.mkdtemp(prefix="kigland_bench_")
+    served = os.path.join(root, "served")
+    os.makedirs(served)
+    bpy.data.libraries.write(os.path.join(served, "bench.blend"), {obj})
+    package.mesh_arrays.save_npz_objects(os.path.join(served, "bench.npz"), [obj])
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(QuietHandler, directory=served))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    results = {}
+    loaded = []
+    cache = package.asset_cache.AssetCache(os.path.join(root, "cache"))
+
+    def load(url):
+        loaded.extend(bench.scripting.load_asset_objects(cache.fetch(url)))
+
+    def teardown():
+        bench.remove(loaded)
+        loaded.clear()
+
+    try:
+        for ext in ("blend", "npz"):
+            url = f"{base_url}/bench.{ext}"
+            results[f"download.{ext}.cold"] = bench.measure(
+                lambda: load(url), setup=cache.clear, teardown=teardown)
+            results[f"download.{ext}.warm"] = bench.measure(lambda: load(url), teardown=teardown)
+    finally:
+        server.shutdown()
+        cache.transport.close()
+        shutil.rmtree(root, ignore_errors=True)
+    return results
+
+
+def run(sizes, repeat=5, keys=50, only=None):
+    import bpy
+
+    scripting = headless.load_addon()
+    groups = [name for name in BENCHMARKS if not only or name in only]
+
+    scene = bpy.data.scenes.new("benchmark")
+    results = {}
+    try:
+        with bpy.context.temp_override(scene=scene, view_layer=scene.view_layers[0],
+                                       collection=scene.collection):
+            bpy.ops.object.init_env_units()
+            bench = Bench(scripting, scene, repeat, keys)
+
+            for name in groups:
+                fn, sized = BENCHMARKS[name]
+                if not sized:
+                    results.update(fn(bench))
+                    continue
+                for triangles in sizes:
+                    obj = bench.new_torus(triangles)
+                    try:
+                        for key, timing in fn(bench, obj).items():
+                            results[f"{key}[{triangles}]"] = timing
+                    finally:
+                        bench.remove([obj])
+                print(f"benchmark: {name} done", file=sys.stderr)
+    finally:
+        for obj in list(scene.objects):
+            bpy.data.objects.remove(obj)
+        bpy.data.scenes.remove(scene)
+
+    return {
+        "meta": {
+            "blender": bpy.app.version_string,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+
+
+def compare(results, baseline, threshold=0.1):
+    """Print the medians against ``baseline``, returns the number of regressions."""
+    regressions = 0
+    print(f"{'benchmark':48} {'baseline':>12} {'current':>12} {'ratio':>8}")
+    for name, timing in results["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            continue
+        ratio = timing["median"] / base["median"] if base["median"] else float("inf")
+        flag = ""
+        if ratio > 1.0 + threshold:
+            flag = "slower"
+            regressions += 1
+        elif ratio < 1.0 / (1.0 + threshold):
+            flag = "faster"
+        print(f"{name:48} {base['median'] * 1000:10.2f}ms {timing['median'] * 1000:10.2f}ms {ratio:7.2f}x {flag}")
+    return regressions
+
+
+def load_results(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else sys.argv[1:]
+
+    parser = argparse.ArgumentParser(prog="benchmark.py", description="Time the toolbox hot paths")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES),
+                        help="triangle counts of the synthetic meshes")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--keys", type=int, default=50, help="shape keys for the shape key benchmark")
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), help="benchmark groups to run")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against an earlier output")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="relative slowdown counted as a regression")
+    parser.add_argument("--compare", nargs=2, metavar=("CURRENT", "BASELINE"),
+                        help="only compare two outputs, no Blender needed")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        current, baseline = (load_results(path) for path in args.compare)
+        return 1 if compare(current, baseline, args.threshold) else 0
+
+    results = run(args.sizes, args.repeat, args.keys, args.only)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=1)
+    else:
+        json.dump(results, sys.stdout, indent=1)
+        print()
+
+    if args.baseline:
+        return 1 if compare(results, load_results(args.baseline), args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
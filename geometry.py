@@ -0,0 +1,489 @@
+import zlib
+from contextlib import contextmanager
+
+import numpy as np
+
+
+# Triangles handled per step, bounds the temporary (T, 3) float64 arrays
+TRIANGLE_CHUNK = 1 << 20
+
+
+def matrix_to_array(matrix):
+    return np.array(matrix, dtype=np.float64).reshape(4, 4)
+
+
+def transform_points(co, matrix):
+    m = matrix_to_array(matrix)
+    return co @ m[:3, :3].T + m[:3, 3]
+
+
+def mesh_vertex_coords(me):
+    co = np.empty(len(me.vertices) * 3, dtype=np.float32)
+    me.vertices.foreach_get("co", co)
+    return co.reshape(-1, 3).astype(np.float64)
+
+
+def mesh_loop_triangles(me):
+    tris = np.empty(len(me.loop_triangles) * 3, dtype=np.int32)
+    me.loop_triangles.foreach_get("vertices", tris)
+    return tris.reshape(-1, 3)
+
+
+def signed_volume(co, tris):
+    # Sum of signed tetrahedra spanned by the origin and each triangle
+    volume = 0.0
+    for start in range(0, len(tris), TRIANGLE_CHUNK):
+        chunk = tris[start:start + TRIANGLE_CHUNK]
+        a, b, c = co[chunk[:, 0]], co[chunk[:, 1]], co[chunk[:, 2]]
+        volume += np.einsum("ij,ij->", a, np.cross(b, c))
+    return volume / 6.0
+
+
+def mesh_signed_volume(me, matrix=None):
+    co = mesh_vertex_coords(me)
+    if matrix is not None:
+        co = transform_points(co, matrix)
+    return signed_volume(co, mesh_loop_triangles(me))
+
+
+@contextmanager
+def evaluated_mesh(obj, depsgraph, apply_modifiers=True):
+    # Unmodified meshes outside edit mode are read in place, anything else
+    # goes through to_mesh() and is freed again on exit
+    if obj.type == 'MESH' and obj.mode != 'EDIT' and not (apply_modifiers and obj.modifiers):
+        yield obj.data
+        return
+
+    obj_eval = obj.evaluated_get(depsgraph) if apply_modifiers else obj
+    try:
+        yield obj_eval.to_mesh()
+    finally:
+        obj_eval.to_mesh_clear()
+
+
+def object_volume(obj, depsgraph, apply_modifiers=True):
+    """World space volume of ``obj``, same as bmesh calc_volume() on a transformed copy."""
+    with evaluated_mesh(obj, depsgraph, apply_modifiers) as me:
+        return abs(mesh_signed_volume(me, obj.matrix_world))
+
+
+def batch_volumes(objects, depsgraph, apply_modifiers=True):
+    """World space volume of each object as ``[(obj, volume)]``.
+
+    Plain objects sharing a mesh read it once, their volume is the local one
+    scaled by the determinant of their world matrix.
+    """
+    local_volumes = {}
+    volumes = []
+    for obj in objects:
+        if obj.type == 'MESH' and obj.mode != 'EDIT' and not (apply_modifiers and obj.modifiers):
+            key = obj.data.as_pointer()
+            if key not in local_volumes:
+                local_volumes[key] = mesh_signed_volume(obj.data)
+            det = np.linalg.det(matrix_to_array(obj.matrix_world)[:3, :3])
+            volumes.append((obj, abs(local_volumes[key] * det)))
+        else:
+            volumes.append((obj, object_volume(obj, depsgraph, apply_modifiers)))
+    return volumes
+
+
+def shape_key_coords(key_block):
+    co = np.empty(len(key_block.data) * 3, dtype=np.float32)
+    key_block.data.foreach_get("co", co)
+    return co.reshape(-1, 3)
+
+
+def vertex_group_weights(obj, names):
+    # {name: (V,) weights} for the named groups of obj. Unknown names are left
+    # out, like Blender ignores them. bpy has no bulk access to deform weights,
+    # so the memberships are read once into flat arrays and scattered by numpy.
+    groups = {obj.vertex_groups[name].index: name for name in names if name in obj.vertex_groups}
+    if not groups:
+        return {}
+
+    vertex_count = len(obj.data.vertices)
+    elements = [v.groups for v in obj.data.vertices]
+    counts = np.fromiter(map(len, elements), dtype=np.int64, count=vertex_count)
+    flat = np.array([(g.group, g.weight) for e in elements for g in e], dtype=np.float64).reshape(-1, 2)
+    vertex = np.repeat(np.arange(vertex_count), counts)
+    group = flat[:, 0].astype(np.int64)
+
+    weights = {}
+    for index, name in groups.items():
+        member = group == index
+        weights[name] = np.zeros(vertex_count, dtype=np.float32)
+        weights[name][vertex[member]] = flat[member, 1]
+    return weights
+
+
+def shape_key_mix(obj):
+    """Coordinates of the evaluated shape key mix of a mesh object, float32 (V, 3).
+
+    Follows Blender's relative key blending: the reference key plus each
+    unmuted key's offset from its relative key, scaled by its value and
+    vertex group. With "Shape Key Lock" the active key is used at full
+    strength. Returns None for absolute (non relative) keys.
+    """
+    shape_keys = obj.data.shape_keys
+    if shape_keys is None or not shape_keys.use_relative:
+        return None
+
+    reference = shape_keys.reference_key
+    base = shape_key_coords(reference)
+
+    if obj.show_only_shape_key:
+        active = obj.active_shape_key
+        if active is None or active == reference:
+            return base
+        weights = vertex_group_weights(obj, [active.vertex_group]).get(active.vertex_group)
+        co = shape_key_coords(active)
+        if weights is None:
+            return co
+        return base + (co - base) * weights[:, None]
+
+    key_blocks = [kb for kb in shape_keys.key_blocks
+                  if kb != reference and not kb.mute and kb.value != 0.0]
+    weights = vertex_group_weights(obj, {kb.vertex_group for kb in key_blocks if kb.vertex_group})
+
+    # Relative keys are mostly the basis, read each of them once
+    relative_coords = {reference.name: base}
+    mix = base.copy()
+    for kb in key_blocks:
+        relative = kb.relative_key
+        if relative.name not in relative_coords:
+            relative_coords[relative.name] = shape_key_coords(relative)
+        delta = shape_key_coords(kb) - relative_coords[relative.name]
+        if kb.vertex_group in weights:
+            mix += delta * (kb.value * weights[kb.vertex_group])[:, None]
+        else:
+            mix += delta * kb.value
+    return mix
+
+
+def mesh_fingerprint(me):
+    # Cheap identity of a mesh state: element counts plus checksums of the
+    # coordinates and topology, one linear pass without Python loops
+    co = np.empty(len(me.vertices) * 3, dtype=np.float32)
+    me.vertices.foreach_get("co", co)
+    vertex_index = np.empty(len(me.loops), dtype=np.int32)
+    me.loops.foreach_get("vertex_index", vertex_index)
+    return (len(me.vertices), len(me.loops), len(me.polygons),
+            zlib.crc32(co.tobytes()), zlib.crc32(vertex_index.tobytes()))
+
+
+def selected_vertex_centroid(me):
+    # Mean of the selected vertices in object space, None without selection
+    select = np.empty(len(me.vertices), dtype=bool)
+    me.vertices.foreach_get("select", select)
+    if not select.any():
+        return None
+    return mesh_vertex_coords(me)[select].mean(axis=0)
+
+
+def objects_bounds(objects):
+    # World space (min, max) of the objects' local bounding boxes, one batched matmul
+    corners = np.array([obj.bound_box for obj in objects], dtype=np.float64)
+    matrices = np.array([obj.matrix_world for obj in objects], dtype=np.float64)
+    world = np.einsum("nij,nkj->nki", matrices[:, :3, :3], corners) + matrices[:, None, :3, 3]
+    return world.min(axis=(0, 1)), world.max(axis=(0, 1))
+
+
+def objects_exact_bounds(objects, depsgraph):
+    # World space (min, max) of the evaluated vertices, objects without a mesh use their box
+    lows, highs = [], []
+    boxed = []
+    for obj in objects:
+        if obj.type != 'MESH':
+            boxed.append(obj)
+            continue
+        me = obj.evaluated_get(depsgraph).data
+        if not len(me.vertices):
+            continue
+        co = transform_points(mesh_vertex_coords(me), obj.matrix_world)
+        lows.append(co.min(axis=0))
+        highs.append(co.max(axis=0))
+
+    if boxed:
+        low, high = objects_bounds(boxed)
+        lows.append(low)
+        highs.append(high)
+    if not lows:
+        return np.zeros(3), np.zeros(3)
+    return np.min(lows, axis=0), np.max(highs, axis=0)
+
+
+def mesh_polygon_arrays(me):
+    vertex_index = np.empty(len(me.loops), dtype=np.int32)
+    me.loops.foreach_get("vertex_index", vertex_index)
+    loop_start = np.empty(len(me.polygons), dtype=np.int32)
+    me.polygons.foreach_get("loop_start", loop_start)
+    return vertex_index, loop_start
+
+
+def plane_normal(co, reference=None):
+    """Unit normal of the plane that best fits unordered (N, 3) points.
+
+    The least squares plane does not depend on the order of the points. The
+    normal is flipped to point along ``reference`` when one is given.
+    """
+    co = co - co.mean(axis=0)
+    # Direction of least spread: the last right singular vector
+    normal = np.linalg.svd(co, full_matrices=False)[2][-1]
+    if reference is not None and np.dot(normal, reference) < 0.0:
+        normal = -normal
+    return normal
+
+
+def faces_frame(co, vertex_index, loop_start, mask=None):
+    """Area weighted centroid and unit normal of polygons, ``None`` if empty.
+
+    Polygon normals come from Newell's method, whose vector is twice the
+    polygon area long, so summing them weights each face by its area.
+    """
+    loop_total = np.diff(np.append(loop_start, len(vertex_index)))
+    if mask is not None:
+        loop_start, loop_total = loop_start[mask], loop_total[mask]
+    if not len(loop_start):
+        return None
+
+    # Gather the loops of the wanted polygons into a contiguous range
+    start = np.cumsum(loop_total) - loop_total
+    loops = np.repeat(loop_start - start, loop_total) + np.arange(loop_total.sum())
+    last = start + loop_total - 1
+    following = np.arange(1, len(loops) + 1)
+    following[last] = start
+
+    points = co[vertex_index[loops]]
+    origin = points.mean(axis=0)
+    points = points - origin
+    newell = np.add.reduceat(np.cross(points, points[following]), start, axis=0)
+    centers = np.add.reduceat(points, start, axis=0) / loop_total[:, None]
+
+    areas = np.linalg.norm(newell, axis=1) * 0.5
+    normal = newell.sum(axis=0)
+    length = np.linalg.norm(normal)
+    if length == 0.0:
+        return None
+
+    if areas.sum() > 0.0:
+        centroid = (centers * areas[:, None]).sum(axis=0) / areas.sum()
+    else:
+        centroid = centers.mean(axis=0)
+    return centroid + origin, normal / length
+
+
+def selected_faces_frame(me):
+    select = np.empty(len(me.polygons), dtype=bool)
+    me.polygons.foreach_get("select", select)
+    if not select.any():
+        return None
+    vertex_index, loop_start = mesh_polygon_arrays(me)
+    return faces_frame(mesh_vertex_coords(me), vertex_index, loop_start, select)
+
+
+def mesh_edge_array(me):
+    edges = np.empty(len(me.edges) * 2, dtype=np.int32)
+    me.edges.foreach_get("vertices", edges)
+    return edges.reshape(-1, 2)
+
+
+# Angular bins of a section outline, see section_perimeter()
+SECTION_BINS = 360
+# Edges handled per step when cutting a section
+EDGE_CHUNK = 1 << 20
+# Height bins of each pass of the widest level search, see widest_level()
+LEVEL_BINS = 64
+# Vertices sampled for the coarse pass
+COARSE_SAMPLES = 200000
+
+
+def section_perimeter(co, edges, z, bins=SECTION_BINS, heights=None):
+    """Length of a tape laid around the horizontal section of a mesh at ``z``.
+
+    The points where edges cross the plane are binned by angle around their
+    centroid and only the outermost point of each bin is kept, so inner
+    shells and folds do not count, like a tape measure would skip them.
+    ``heights`` is the Z column of ``co``, pass a contiguous copy when cutting
+    the same mesh more than once.
+    """
+    heights = co[:, 2] if heights is None else heights
+    above = heights > z
+    chunks = []
+    for start in range(0, len(edges), EDGE_CHUNK):
+        chunk = edges[start:start + EDGE_CHUNK]
+        crossed = chunk[above[chunk[:, 0]] != above[chunk[:, 1]]]
+        if not len(crossed):
+            continue
+        # Only the crossing edges are gathered in full
+        da, db = heights[crossed[:, 0]] - z, heights[crossed[:, 1]] - z
+        t = da / (da - db)
+        a, b = co[crossed[:, 0], :2], co[crossed[:, 1], :2]
+        chunks.append(a + (b - a) * t[:, None])
+    if not chunks or sum(len(chunk) for chunk in chunks) < 3:
+        return 0.0
+
+    points = np.concatenate(chunks)
+    offsets = points - points.mean(axis=0)
+    angles = np.arctan2(offsets[:, 1], offsets[:, 0])
+    radii = np.hypot(offsets[:, 0], offsets[:, 1])
+
+    # Outermost point per bin: sort by bin then radius, take the last of each run
+    bin_index = np.minimum(((angles + np.pi) / (2.0 * np.pi) * bins).astype(np.int64), bins - 1)
+    order = np.lexsort((radii, bin_index))
+    last = np.append(bin_index[order][1:] != bin_index[order][:-1], True)
+    outline = points[order[last]]
+    if len(outline) < 3:
+        return 0.0
+    return float(np.linalg.norm(np.roll(outline, -1, axis=0) - outline, axis=1).sum())
+
+
+def width_profile(z, x, low, high, bins):
+    # X extent of the points in each height bin between low and high, 0 where a bin is empty
+    index = np.clip(((z - low) / (high - low) * bins).astype(np.int64), 0, bins - 1)
+    x_max = np.full(bins, -np.inf)
+    x_min = np.full(bins, np.inf)
+    np.maximum.at(x_max, index, x)
+    np.minimum.at(x_min, index, x)
+    filled = np.isfinite(x_max)
+    widths = np.zeros(bins)
+    widths[filled] = x_max[filled] - x_min[filled]
+    return widths
+
+
+def widest_level(x, z, bins=LEVEL_BINS):
+    """Height of the widest horizontal section given the X and Z columns.
+
+    A coarse width profile over a sample of the vertices finds the widest
+    bin, a fine profile of all vertices around it finds the level.
+    """
+    low, high = z.min(), z.max()
+    if high <= low:
+        return float(low)
+
+    stride = max(1, len(z) // COARSE_SAMPLES)
+    best = int(np.argmax(width_profile(z[::stride], x[::stride], low, high, bins)))
+    step = (high - low) / bins
+    band_low = low + max(best - 1, 0) * step
+    band_high = low + min(best + 2, bins) * step
+
+    in_band = (z >= band_low) & (z <= band_high)
+    best = int(np.argmax(width_profile(z[in_band], x[in_band], band_low, band_high, bins)))
+    return float(band_low + (best + 0.5) * (band_high - band_low) / bins)
+
+
+def head_measures(co, edges):
+    """(height, width, circumference) of head vertices given in world space.
+
+    The circumference is the tape length around the widest horizontal section.
+    """
+    # NOTE: reductions over contiguous columns are several times faster than over axis 0 of (V, 3)
+    x, _, z = np.ascontiguousarray(co.T)
+    height = z.max() - z.min()
+    width = x.max() - x.min()
+    circumference = section_perimeter(co, edges, widest_level(x, z), heights=z)
+    return float(height), float(width), circumference
+
+
+# Cells along the longer side of the support grid, see support_volume()
+SUPPORT_GRID = 512
+# Surface samples spread over large triangles, on top of one per triangle
+SUPPORT_SAMPLES = 1 << 21
+# Upward surface points per grid cell, more than one so that no cell is left empty
+SUPPORT_SURFACE_DENSITY = 4
+# Steps of the R2 sequence, the inverse powers of the plastic number
+R2_STEPS = (0.7548776662466927, 0.5698402909980532)
+
+
+def triangle_normals_areas(co, tris):
+    a = co[tris[:, 0]]
+    cross = np.cross(co[tris[:, 1]] - a, co[tris[:, 2]] - a)
+    length = np.linalg.norm(cross, axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        normals = np.nan_to_num(cross / length[:, None])
+    return normals, length * 0.5
+
+
+def _build_frame(up):
+    # Orthonormal (u, v, up) with up the build direction
+    up = np.asarray(up, dtype=np.float64)
+    up = up / np.linalg.norm(up)
+    helper = np.array((1.0, 0.0, 0.0)) if abs(up[0]) < 0.9 else np.array((0.0, 1.0, 0.0))
+    u = np.cross(up, helper)
+    u /= np.linalg.norm(u)
+    return np.stack((u, np.cross(up, u), up))
+
+
+def _surface_samples(co, tris, weights, cell_area):
+    """Points spread over the triangles, about one per ``cell_area`` of ``weights``.
+
+    The points of each triangle follow the R2 low discrepancy sequence, which
+    covers it far more evenly than random points. Returns the points, the
+    triangle each one lies on and the point count of every triangle.
+    """
+    counts = np.maximum(np.ceil(weights / cell_area), 1).astype(np.int64)
+    index = np.repeat(np.arange(len(tris)), counts)
+    rank = np.arange(len(index)) - np.repeat(np.cumsum(counts) - counts, counts)
+    r1 = (0.5 + rank * R2_STEPS[0]) % 1.0
+    r2 = (0.5 + rank * R2_STEPS[1]) % 1.0
+    # Folded into the triangle, single points go to the centroid
+    flip = r1 + r2 > 1.0
+    r1[flip], r2[flip] = 1.0 - r1[flip], 1.0 - r2[flip]
+    single = counts[index] == 1
+    r1[single] = r2[single] = 1.0 / 3.0
+    t = tris[index]
+    a = co[t[:, 0]]
+    points = a + (co[t[:, 1]] - a) * r1[:, None] + (co[t[:, 2]] - a) * r2[:, None]
+    return points, index, counts
+
+
+def support_volume(co, tris, up=(0.0, 0.0, 1.0), overhang_angle=np.radians(45.0), grid=SUPPORT_GRID):
+    """Volume of the support columns under the overhangs of a triangle mesh.
+
+    Triangles facing down more steeply than ``overhang_angle`` from vertical
+    need support. Each one is projected along ``up`` onto the highest upward
+    facing surface below it in the same grid cell, or down to the bed at the
+    lowest point of the mesh. The result is the solid volume of those
+    columns, scale it by the support infill to get the material.
+    """
+    if not len(tris):
+        return 0.0
+
+    frame = _build_frame(up)
+    co = co @ frame.T
+    normals, areas = triangle_normals_areas(co, tris)
+    facing = normals[:, 2]
+    projected = areas * np.abs(facing)
+    overhang = facing < -np.sin(overhang_angle)
+    if not overhang.any():
+        return 0.0
+    upward = facing > 0.0
+
+    low, high = co.min(axis=0), co.max(axis=0)
+    extent = high - low
+    cell = max(extent[0], extent[1]) / grid
+    # Coarser cells when the surface would need too many samples
+    cell = max(cell, np.sqrt(projected[overhang | upward].sum() * SUPPORT_SURFACE_DENSITY / SUPPORT_SAMPLES), 1e-9)
+    columns = int(extent[0] / cell) + 1
+
+    def cell_keys(points):
+        ij = ((points[:, :2] - low[:2]) / cell).astype(np.int64)
+        return ij[:, 1] * columns + ij[:, 0]
+
+    # Upward surfaces sorted by (cell, height) in one float key
+    surface, _, _ = _surface_samples(co, tris[upward], projected[upward], cell * cell / SUPPORT_SURFACE_DENSITY)
+    span = extent[2] + 1.0
+    surface_keys = np.sort(cell_keys(surface) * span + (surface[:, 2] - low[2]))
+
+    points, index, counts = _surface_samples(co, tris[overhang], projected[overhang], cell * cell)
+    keys = cell_keys(points)
+    heights = points[:, 2] - low[2]
+    # NOTE: a small tolerance so an overhang resting flat on an upward face needs no support
+    tolerance = cell * 1e-3
+    below = np.searchsorted(surface_keys, keys * span + heights + tolerance) - 1
+    found = below >= 0
+    found[found] = np.floor(surface_keys[below[found]] / span) == keys[found]
+    floor = np.zeros(len(points))
+    floor[found] = surface_keys[below[found]] - keys[found] * span
+
+    weights = projected[overhang][index] / counts[index]
+    return float((weights * np.maximum(heights - floor, 0.0)).sum())
@@ -0,0 +1,134 @@
+import numpy as np
+
+
+# Head size library: an .npz holding every GB/T size as per-vertex offsets
+# from the A2 reference head (ref_head_a2), with
+#   "version"  int32
+#   "sizes"    str     (S,)       size names in ascending order, "A2" first
+#   "measures" float32 (S, 3)     height, width, circumference of each size
+#   "steps"    float32 (S,)       quantisation step of each size
+#   "deltas"   int16   (S, V, 3)  offsets from the base vertices, in steps
+# Offsets are in the base object's local space, measures in mm.
+
+HEAD_LIBRARY_VERSION = 1
+QUANTISATION_LEVELS = 32767
+# Resolution of the size parameter search, per interval between two sizes
+FIT_RESOLUTION = 200
+
+
+class HeadLibrary:
+    def __init__(self, sizes, measures, steps, deltas):
+        self.sizes = [str(size) for size in sizes]
+        self.measures = np.asarray(measures, dtype=np.float64)
+        self.steps = np.asarray(steps, dtype=np.float64)
+        self.deltas = deltas
+
+    @property
+    def vertex_count(self):
+        return self.deltas.shape[1]
+
+    def size_weights(self, size):
+        weights = np.zeros(len(self.sizes))
+        weights[self.sizes.index(size)] = 1.0
+        return weights
+
+    def blend(self, base_co, weights):
+        """Base vertices plus the weighted offsets of the sizes, float64 (V, 3)."""
+        co = np.asarray(base_co, dtype=np.float64).copy()
+        for i in np.flatnonzero(weights):
+            # NOTE: one size at a time, never the whole (S, V, 3) block as floats
+            co += self.deltas[i] * (weights[i] * self.steps[i])
+        return co
+
+    def fit(self, height, width, circumference):
+        """Weights and residual per axis scale that best match the measurements.
+
+        The sizes form a path through (height, width, circumference) space.
+        The closest point on it, by relative error of all three measures, gives
+        a blend of two neighbouring sizes. What the blend still misses is made
+        up by scaling: X for the width, Z for the height and Y so that the
+        widest section gets the wanted circumference.
+        """
+        target = np.array((height, width, circumference), dtype=np.float64)
+        weights = np.zeros(len(self.sizes))
+        if len(self.sizes) == 1:
+            weights[0] = 1.0
+            blended = self.measures[0]
+        else:
+            t = np.linspace(0.0, len(self.sizes) - 1, (len(self.sizes) - 1) * FIT_RESOLUTION + 1)
+            i = np.minimum(t.astype(np.int64), len(self.sizes) - 2)
+            f = t - i
+            path = self.measures[i] * (1.0 - f)[:, None] + self.measures[i + 1] * f[:, None]
+            best = np.argmin((((path - target) / target) ** 2).sum(axis=1))
+            weights[i[best]] = 1.0 - f[best]
+            weights[i[best] + 1] += f[best]
+            blended = path[best]
+
+        blended_height, blended_width, blended_circumference = blended
+        scale_x = width / blended_width
+        scale_z = height / blended_height
+        # Section depth of the blend, then the depth that gives the wanted circumference at the new width
+        depth = ellipse_semi_axis(blended_width / 2.0, blended_circumference)
+        wanted_depth = ellipse_semi_axis(width / 2.0, circumference)
+        scale_y = wanted_depth / depth if depth > 0.0 else 1.0
+        return weights, (scale_x, scale_y, scale_z)
+
+
+def ellipse_perimeter(a, b):
+    # Ramanujan's approximation
+    return np.pi * (3.0 * (a + b) - np.sqrt((3.0 * a + b) * (a + 3.0 * b)))
+
+
+def ellipse_semi_axis(a, perimeter, iterations=60):
+    """Semi-axis b of the ellipse with semi-axis ``a`` and the given perimeter."""
+    low, high = 0.0, perimeter / 4.0
+    if ellipse_perimeter(a, low) >= perimeter:
+        return 0.0
+    for _ in range(iterations):
+        mid = (low + high) * 0.5
+        if ellipse_perimeter(a, mid) < perimeter:
+            low = mid
+        else:
+            high = mid
+    return (low + high) * 0.5
+
+
+def quantise(deltas):
+    """int16 offsets and the step they are counted in."""
+    deltas = np.asarray(deltas, dtype=np.float64)
+    peak = np.abs(deltas).max() if deltas.size else 0.0
+    step = peak / QUANTISATION_LEVELS if peak > 0.0 else 1.0
+    return np.round(deltas / step).astype(np.int16), step
+
+
+def build_library(base_co, sizes, size_coords, measures):
+    """Library from the base vertices and the vertices of each size in the same order."""
+    base_co = np.asarray(base_co, dtype=np.float64)
+    deltas, steps = [], []
+    for co in size_coords:
+        if len(co) != len(base_co):
+            raise ValueError(f"Size has {len(co)} vertices, the base has {len(base_co)}")
+        quantised, step = quantise(np.asarray(co, dtype=np.float64) - base_co)
+        deltas.append(quantised)
+        steps.append(step)
+    return HeadLibrary(sizes, measures, steps, np.stack(deltas))
+
+
+def save_library(path, library):
+    with open(path, "wb") as f:
+        np.savez(
+            f,
+            version=np.array(HEAD_LIBRARY_VERSION, dtype=np.int32),
+            sizes=np.array(library.sizes),
+            measures=library.measures.astype(np.float32),
+            steps=library.steps.astype(np.float32),
+            deltas=library.deltas.astype(np.int16),
+        )
+
+
+def load_library(path):
+    with np.load(path, allow_pickle=False) as data:
+        version = int(data["version"])
+        if version > HEAD_LIBRARY_VERSION:
+            raise ValueError(f"{path} is format version {version}, this add-on reads up to {HEAD_LIBRARY_VERSION}")
+        return HeadLibrary(data["sizes"], data["measures"], data["steps"], data["deltas"])
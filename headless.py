@@ -0,0 +1,297 @@
+"""Run orders without the UI.
+
+Inside Blender::
+
+    blender -b --factory-startup -P headless.py -- job.json [job.json ...]
+
+or with the ``bpy`` module, ``import headless; headless.run_job_file("job.json")``.
+From a plain Python the jobs are handed to a pool of Blender processes::
+
+    python headless.py --workers 8 jobs/*.json
+
+A job is a JSON object::
+
+    {
+        "order_id": "A01-0042",
+        "full_label": false,
+        "label": {"target": "ref_head_a2", "faces": [12, 13]},
+        "head": {"head_height": 240.0, "head_width": 180.0, "head_gen_scale_by": "SCALE_BY_HEIGHT"},
+        "eyes_spacing": 70.0,
+        "components": ["head", "eyes_hole", "ears", "lock"],
+        "density": 1.13,
+        "material_cost": 0.35,
+        "output": "out/A01-0042",
+        "export": ["stl", "blend"]
+    }
+
+``head`` takes any field of the Body & Head panel, ``output`` is relative to
+the job file. The result, with the volume, weight and cost of every part, is
+written to ``<output>/<order_id>.json``. The order label is exported with the
+parts but costed on its own, outside the totals.
+"""
+
+import argparse
+import importlib
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+
+ADDON_DIR = os.path.dirname(os.path.abspath(__file__))
+# Module name the add-on gets when it is not installed
+FALLBACK_PACKAGE = "kigland_toolbox"
+
+# Job component name -> generator operator in bpy.ops.object
+COMPONENT_OPERATORS = {
+    "head": "gen_gbt_head",
+    "eyes_hole": "gen_eyes_hole",
+    "ears": "gen_kigland_ears",
+    "logo": "gen_kigland_logo",
+    "lock": "gen_lock_components",
+}
+
+EXPORT_FORMATS = ("stl", "blend")
+
+
+def have_bpy():
+    return importlib.util.find_spec("bpy") is not None
+
+
+def _import_package():
+    # The installed add-on if this file belongs to one, else load the folder
+    # under a fixed name so the relative imports resolve
+    import addon_utils
+
+    for mod in addon_utils.modules():
+        if os.path.dirname(os.path.abspath(mod.__file__)) == ADDON_DIR:
+            return importlib.import_module(mod.__name__)
+
+    if FALLBACK_PACKAGE in sys.modules:
+        return sys.modules[FALLBACK_PACKAGE]
+    spec = importlib.util.spec_from_file_location(
+        FALLBACK_PACKAGE, os.path.join(ADDON_DIR, "__init__.py"), submodule_search_locations=[ADDON_DIR])
+    package = importlib.util.module_from_spec(spec)
+    sys.modules[FALLBACK_PACKAGE] = package
+    spec.loader.exec_module(package)
+    return package
+
+
+def load_addon():
+    """Return the add-on's scripting module, registered."""
+    import bpy
+
+    package = sys.modules[__package__] if __package__ else _import_package()
+    if "head_data" not in bpy.types.Scene.bl_rna.properties:
+        package.register()
+    return package.scripting
+
+
+def read_job(path):
+    with open(path, "r", encoding="utf-8") as f:
+        job = json.load(f)
+    if not job.get("order_id"):
+        raise ValueError(f"{path} has no order_id")
+
+    unknown = [name for name in job.get("components", []) if name not in COMPONENT_OPERATORS]
+    if unknown:
+        raise ValueError(f"Unknown component(s) {', '.join(unknown)}, use {', '.join(COMPONENT_OPERATORS)}")
+    unknown = [fmt for fmt in job.get("export", ["stl"]) if fmt not in EXPORT_FORMATS]
+    if unknown:
+        raise ValueError(f"Unknown export format(s) {', '.join(unknown)}, use {', '.join(EXPORT_FORMATS)}")
+
+    job["output"] = os.path.join(os.path.dirname(os.path.abspath(path)), job.get("output", job["order_id"]))
+    return job
+
+
+def export_objects(scene, objects, output, order_id, formats):
+    import bpy
+
+    paths = []
+    for obj in scene.objects:
+        obj.select_set(obj in objects)
+
+    if "stl" in formats:
+        path = os.path.join(output, f"{order_id}.stl")
+        if hasattr(bpy.ops.wm, "stl_export"):
+            bpy.ops.wm.stl_export(filepath=path, export_selected_objects=True, apply_modifiers=True)
+        else:
+            # NOTE: Blender 4.0 only has the legacy exporter
+            bpy.ops.export_mesh.stl(filepath=path, use_selection=True, use_mesh_modifiers=True)
+        paths.append(path)
+
+    if "blend" in formats:
+        path = os.path.join(output, f"{order_id}.blend")
+        bpy.data.libraries.write(path, set(objects), fake_user=True)
+        paths.append(path)
+
+    return paths
+
+
+def run_job(job):
+    """Generate, cost and export one job read by read_job(), returns its result."""
+    import bpy
+
+    scripting = load_addon()
+    package = sys.modules[scripting.__package__]
+
+    # A scene of its own per job, so one Blender instance can run many of them
+    meshes_before = set(bpy.data.meshes)
+    scene = bpy.data.scenes.new(f"order {job['order_id']}")
+    try:
+        with bpy.context.temp_override(scene=scene, view_layer=scene.view_layers[0],
+                                       collection=scene.collection):
+            bpy.ops.object.init_env_units()
+
+            head_data = scene.head_data
+            for key, value in job.get("head", {}).items():
+                if not hasattr(head_data, key):
+                    raise ValueError(f"Unknown head field {key}")
+                setattr(head_data, key, value)
+            if "eyes_spacing" in job:
+                head_data.eyes_spacing = job["eyes_spacing"]
+
+            cost_monitor = scene.cost_monitor
+            cost_monitor.density = job.get("density", cost_monitor.density)
+            cost_monitor.material_cost = job.get("material_cost", cost_monitor.material_cost)
+
+            for name in job.get("components", []):
+                result = getattr(bpy.ops.object, COMPONENT_OPERATORS[name])('EXEC_DEFAULT')
+                if 'FINISHED' not in result:
+                    raise RuntimeError(f"Generating {name} failed")
+
+            label = job.get("label", {})
+            entry = {
+                "order_id": job["order_id"],
+                "full_label": job.get("full_label"),
+                "target": label.get("target"),
+                "faces": label.get("faces", []),
+            }
+            glyphs = scripting.get_glyph_cache()
+            [(_, label_obj)] = package.order_labels.generate_labels_from_manifest(
+                scene.collection, [entry], objects=scene.objects, glyphs=glyphs)
+            glyphs.save()
+            if isinstance(label_obj, Exception):
+                raise label_obj
+
+            objects = [obj for obj in scene.objects if obj.type == 'MESH']
+            volumes = package.geometry.batch_volumes(objects, bpy.context.evaluated_depsgraph_get())
+            parts = []
+            label = None
+            for obj, volume in volumes:
+                volume_fmt, weight_str, cost_str = scripting.calc_costs(scene, cost_monitor, volume)
+                part = {"name": obj.name, "volume": volume_fmt, "weight": weight_str, "cost": cost_str}
+                if obj == label_obj:
+                    label = part
+                else:
+                    parts.append(part)
+            total_volume = sum(volume for obj, volume in volumes if obj != label_obj)
+            volume_fmt, weight_str, cost_str = scripting.calc_costs(scene, cost_monitor, total_volume)
+
+            os.makedirs(job["output"], exist_ok=True)
+            files = export_objects(scene, objects, job["output"], job["order_id"], job.get("export", ["stl"]))
+    finally:
+        for obj in list(scene.objects):
+            bpy.data.objects.remove(obj)
+        bpy.data.scenes.remove(scene)
+        # Meshes of this job, component meshes stay for the next job to share
+        registry_key = scripting.component_registry.ASSET_KEY
+        for me in set(bpy.data.meshes) - meshes_before:
+            if me.users == 0 and registry_key not in me:
+                bpy.data.meshes.remove(me)
+
+    result = {
+        "order_id": job["order_id"],
+        "parts": parts,
+        "label": label,
+        "total": {"volume": volume_fmt, "weight": weight_str, "cost": cost_str},
+        "files": files,
+    }
+    with open(os.path.join(job["output"], f"{job['order_id']}.json"), "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    return result
+
+
+def run_job_file(path):
+    return run_job(read_job(path))
+
+
+def run_pool(job_paths, workers, blender="blender"):
+    """Spread the jobs over ``workers`` Blender processes, returns the failed job count.
+
+    Each process takes its share of the jobs in one go, so the startup cost
+    and the component and glyph caches are shared by them. A job counts as
+    done when its result file exists afterwards.
+    """
+    failed = 0
+    result_paths = {}
+    for path in job_paths:
+        try:
+            result_path = _result_path(path)
+            # NOTE: a result left by an earlier run must not pass for this one
+            if os.path.exists(result_path):
+                os.remove(result_path)
+        except (OSError, ValueError) as e:
+            print(f"{path}: {e}", file=sys.stderr)
+            failed += 1
+            continue
+        result_paths[path] = result_path
+
+    runnable = list(result_paths)
+    if not runnable:
+        return failed
+    chunks = [runnable[i::workers] for i in range(min(workers, len(runnable)))]
+
+    def run(chunk):
+        command = [blender, "-b", "--factory-startup", "-noaudio", "-P", os.path.abspath(__file__),
+                   "--", *chunk]
+        return subprocess.run(command, capture_output=True, text=True)
+
+    with ThreadPoolExecutor(max_workers=len(chunks)) as pool:
+        for chunk, process in zip(chunks, pool.map(run, chunks)):
+            sys.stdout.write(process.stdout)
+            missing = sum(not os.path.exists(result_paths[path]) for path in chunk)
+            if process.returncode != 0 or missing:
+                sys.stderr.write(process.stderr)
+            failed += missing
+    return failed
+
+
+def _result_path(job_path):
+    job = read_job(job_path)
+    return os.path.join(job["output"], f"{job['order_id']}.json")
+
+
+def main(argv=None):
+    if argv is None:
+        # Blender keeps its own arguments before "--"
+        argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else sys.argv[1:]
+
+    parser = argparse.ArgumentParser(prog="headless.py", description="Generate, cost and export orders")
+    parser.add_argument("jobs", nargs="+", help="job JSON files")
+    parser.add_argument("-j", "--workers", type=int, default=1,
+                        help="Blender processes to spread the jobs over")
+    parser.add_argument("--blender", default=os.environ.get("BLENDER", "blender"),
+                        help="Blender executable for the workers")
+    args = parser.parse_args(argv)
+
+    if not have_bpy() or (args.workers > 1 and len(args.jobs) > 1):
+        failed = run_pool(args.jobs, max(args.workers, 1), args.blender)
+    else:
+        failed = 0
+        for path in args.jobs:
+            try:
+                result = run_job_file(path)
+            except Exception as e:  # noqa: BLE001 one bad job must not stop the batch
+                print(f"{path}: {e}", file=sys.stderr)
+                failed += 1
+                continue
+            print(f"{result['order_id']}: {result['total']['cost']} -> {', '.join(result['files'])}")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
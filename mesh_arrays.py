@@ -0,0 +1,131 @@
+import zipfile
+
+import bpy
+import numpy as np
+
+
+# Compact component format: an uncompressed .npz with, per object i,
+#   "{i}.co"           float32 (V, 3)  vertex coordinates
+#   "{i}.vertex_index" int32   (L,)    loop -> vertex
+#   "{i}.loop_start"   int32   (P,)    first loop of each polygon, ascending
+#   "{i}.matrix"       float32 (4, 4)  object matrix_basis
+# and "names", the object names. Members are stored, not deflated, so they
+# can be memory-mapped straight out of the archive.
+
+NPZ_VERSION = 1
+
+
+def mesh_to_arrays(me):
+    co = np.empty(len(me.vertices) * 3, dtype=np.float32)
+    me.vertices.foreach_get("co", co)
+    vertex_index = np.empty(len(me.loops), dtype=np.int32)
+    me.loops.foreach_get("vertex_index", vertex_index)
+    loop_start = np.empty(len(me.polygons), dtype=np.int32)
+    me.polygons.foreach_get("loop_start", loop_start)
+
+    return {
+        "co": co.reshape(-1, 3),
+        "vertex_index": vertex_index,
+        "loop_start": loop_start,
+    }
+
+
+def mesh_from_arrays(name, co, vertex_index, loop_start):
+    me = bpy.data.meshes.new(name)
+    me.vertices.add(len(co))
+    me.loops.add(len(vertex_index))
+    me.polygons.add(len(loop_start))
+
+    # foreach_set takes any contiguous buffer, memory-maps included
+    me.vertices.foreach_set("co", np.ascontiguousarray(co, dtype=np.float32).reshape(-1))
+    me.loops.foreach_set("vertex_index", np.ascontiguousarray(vertex_index, dtype=np.int32))
+    me.polygons.foreach_set("loop_start", np.ascontiguousarray(loop_start, dtype=np.int32))
+
+    me.update(calc_edges=True)
+    return me
+
+
+def save_npz(path, objects):
+    """Write ``[(name, arrays, matrix)]`` as a component file."""
+    members = {
+        "version": np.array(NPZ_VERSION, dtype=np.int32),
+        "names": np.array([name for name, _, _ in objects]),
+    }
+    for i, (_, arrays, matrix) in enumerate(objects):
+        members[f"{i}.co"] = np.asarray(arrays["co"], dtype=np.float32)
+        members[f"{i}.vertex_index"] = np.asarray(arrays["vertex_index"], dtype=np.int32)
+        members[f"{i}.loop_start"] = np.asarray(arrays["loop_start"], dtype=np.int32)
+        members[f"{i}.matrix"] = np.asarray(matrix, dtype=np.float32).reshape(4, 4)
+
+    with open(path, "wb") as f:
+        np.savez(f, **members)
+
+
+def _mmap_member(path, info):
+    # Locate the .npy payload of a stored member and map it without reading it
+    with open(path, "rb") as f:
+        f.seek(info.header_offset)
+        header = f.read(30)
+        name_length = int.from_bytes(header[26:28], "little")
+        extra_length = int.from_bytes(header[28:30], "little")
+        f.seek(info.header_offset + 30 + name_length + extra_length)
+
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+
+    if dtype.hasobject:
+        raise ValueError(f"{info.filename} holds Python objects")
+    if not shape or 0 in shape:
+        return np.zeros(shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=shape,
+                     order="F" if fortran_order else "C")
+
+
+def load_npz(path, mmap=True):
+    """Read a component file as ``[(name, arrays, matrix)]``.
+
+    Stored members are memory-mapped, deflated ones fall back to a normal read.
+    """
+    members = {}
+    with zipfile.ZipFile(path) as archive:
+        for info in archive.infolist():
+            key = info.filename[:-len(".npy")]
+            if mmap and info.compress_type == zipfile.ZIP_STORED and key not in ("names", "version"):
+                members[key] = _mmap_member(path, info)
+            else:
+                with archive.open(info) as f:
+                    members[key] = np.lib.format.read_array(f, allow_pickle=False)
+
+    version = int(members.get("version", NPZ_VERSION))
+    if version > NPZ_VERSION:
+        raise ValueError(f"{path} is format version {version}, this add-on reads up to {NPZ_VERSION}")
+
+    objects = []
+    for i, name in enumerate(members["names"]):
+        arrays = {
+            "co": members[f"{i}.co"],
+            "vertex_index": members[f"{i}.vertex_index"],
+            "loop_start": members[f"{i}.loop_start"],
+        }
+        objects.append((str(name), arrays, members[f"{i}.matrix"]))
+    return objects
+
+
+def load_npz_objects(path, collection):
+    loaded_objects = []
+    for name, arrays, matrix in load_npz(path):
+        me = mesh_from_arrays(name, arrays["co"], arrays["vertex_index"], arrays["loop_start"])
+        obj = bpy.data.objects.new(name, me)
+        obj.matrix_basis = [list(row) for row in matrix]
+        collection.objects.link(obj)
+        loaded_objects.append(obj)
+    return loaded_objects
+
+
+def save_npz_objects(path, objects):
+    save_npz(path, [(obj.name, mesh_to_arrays(obj.data), [list(row) for row in obj.matrix_basis])
+                    for obj in objects])
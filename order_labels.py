@@ -0,0 +1,413 @@
+import csv
+import json
+import logging
+import os
+import zipfile
+
+import bmesh
+import bpy
+import numpy as np
+from mathutils import Vector
+
+from . import geometry, mesh_arrays
+
+
+log = logging.getLogger(__name__)
+
+# Label size in scene units, same as the operator based generator used
+LABEL_HEIGHT = 3.0
+FULL_LABEL_HEIGHT = 10.0
+LABEL_DEPTH = 2.0
+# Gap between labels of a batch that are not placed on a target
+BATCH_SPACING = 5.0
+
+GLYPH_CACHE_VERSION = 1
+# Characters of order IDs and the full label header, others are added on demand
+GLYPH_ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789-."
+
+
+def label_body(order_id, full_label=False):
+    if full_label:
+        return f'KIG.LAND\nKIGURUMI\n{order_id}'
+    return f'{order_id}'
+
+
+def text_to_mesh(body, name="label.order"):
+    # Flat mesh of the text fill, made without linking anything to the scene
+    font_curve = bpy.data.curves.new(type='FONT', name='Font Curve')
+    font_curve.body = body
+    text_obj = bpy.data.objects.new(name, font_curve)
+    try:
+        return bpy.data.meshes.new_from_object(text_obj)
+    finally:
+        bpy.data.objects.remove(text_obj)
+        bpy.data.curves.remove(font_curve)
+
+
+def extrude_mesh(me, depth):
+    bm = bmesh.new()
+    bm.from_mesh(me)
+    ret = bmesh.ops.extrude_face_region(bm, geom=bm.faces[:])
+    extruded = [ele for ele in ret["geom"] if isinstance(ele, bmesh.types.BMVert)]
+    bmesh.ops.translate(bm, vec=(0.0, 0.0, depth), verts=extruded)
+    bmesh.ops.recalc_face_normals(bm, faces=bm.faces[:])
+    bm.to_mesh(me)
+    bm.free()
+
+
+def fit_and_extrude(me, target_height, depth=LABEL_DEPTH):
+    """Scale the flat text to ``target_height``, center it on its bounds and
+    extrude it by ``depth`` along +Z. Returns the bounds center after scaling,
+    which is where the object origin would have been.
+    """
+    co = geometry.mesh_vertex_coords(me)
+    if not len(co):
+        raise ValueError("Label text has no geometry")
+
+    low, high = co.min(axis=0), co.max(axis=0)
+    height = high[1] - low[1]
+    if height <= 0.0:
+        raise ValueError("Label text has no height")
+
+    scale_factor = target_height / height
+    center = (low + high) * 0.5
+    co = (co - center) * scale_factor
+    me.vertices.foreach_set("co", co.astype(np.float32).reshape(-1))
+    extrude_mesh(me, depth)
+
+    return Vector(center * scale_factor)
+
+
+def _text_x_max(body):
+    me = text_to_mesh(body)
+    try:
+        co = geometry.mesh_vertex_coords(me)
+        return co[:, 0].max() if len(co) else 0.0
+    finally:
+        bpy.data.meshes.remove(me)
+
+
+class GlyphCache:
+    """Extruded meshes of single characters in font units, built once.
+
+    Each glyph is stored as mesh arrays (see mesh_arrays) extruded by one unit
+    along +Z, plus its advance width. Labels are assembled by offsetting and
+    concatenating glyphs, so the font is only evaluated for unseen characters.
+    With ``path`` set the glyphs are also kept in an .npz between sessions.
+
+    NOTE: glyphs are placed by advance width alone, kerning pairs are ignored
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._glyphs = {}
+        self._line_height = None
+        self._dirty = False
+        if path is not None:
+            self._load()
+
+    def _load(self):
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                if int(data["version"]) != GLYPH_CACHE_VERSION:
+                    return
+                chars = str(data["chars"])
+                advances = data["advances"]
+                vert_offsets, loop_offsets, poly_offsets = data["vert_offsets"], data["loop_offsets"], data["poly_offsets"]
+                co, vertex_index, loop_start = data["co"], data["vertex_index"], data["loop_start"]
+                self._line_height = float(data["line_height"])
+        except FileNotFoundError:
+            return
+        except (OSError, KeyError, ValueError, EOFError, zipfile.BadZipFile):
+            # NOTE: a truncated or foreign file is dropped so that the next save() replaces it
+            log.warning("Discarding unreadable glyph cache %s", self.path)
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+            return
+
+        for i, char in enumerate(chars):
+            v0, v1 = vert_offsets[i], vert_offsets[i + 1]
+            l0, l1 = loop_offsets[i], loop_offsets[i + 1]
+            p0, p1 = poly_offsets[i], poly_offsets[i + 1]
+            self._glyphs[char] = ({
+                "co": co[v0:v1],
+                "vertex_index": vertex_index[l0:l1] - v0,
+                "loop_start": loop_start[p0:p1] - l0,
+            }, float(advances[i]))
+
+    def save(self):
+        """Write the glyphs to ``path`` if any were added since the last save."""
+        if self.path is None or not self._dirty:
+            return
+
+        chars = "".join(self._glyphs)
+        glyphs = [self._glyphs[char][0] for char in chars]
+        co, vertex_index, loop_start = self._concatenate([(glyph, 0.0, 0.0) for glyph in glyphs])
+        counts = np.array([(len(g["co"]), len(g["vertex_index"]), len(g["loop_start"])) for g in glyphs],
+                          dtype=np.int64).reshape(-1, 3)
+        offsets = np.vstack([np.zeros((1, 3), dtype=np.int64), np.cumsum(counts, axis=0)])
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                version=np.array(GLYPH_CACHE_VERSION, dtype=np.int32),
+                chars=np.array(chars),
+                advances=np.array([self._glyphs[char][1] for char in chars], dtype=np.float64),
+                line_height=np.array(self.line_height(), dtype=np.float64),
+                vert_offsets=offsets[:, 0],
+                loop_offsets=offsets[:, 1],
+                poly_offsets=offsets[:, 2],
+                co=co,
+                vertex_index=vertex_index,
+                loop_start=loop_start,
+            )
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+
+    def line_height(self):
+        if self._line_height is None:
+            # Distance between the baselines of two lines, measured on their lowest points
+            me = text_to_mesh("H\nH")
+            low = geometry.mesh_vertex_coords(me)[:, 1].min()
+            bpy.data.meshes.remove(me)
+            me = text_to_mesh("H")
+            self._line_height = geometry.mesh_vertex_coords(me)[:, 1].min() - low
+            bpy.data.meshes.remove(me)
+            self._dirty = True
+        return self._line_height
+
+    def glyph(self, char):
+        """Return ``(arrays, advance)`` of ``char``, converting it on first use."""
+        cached = self._glyphs.get(char)
+        if cached is not None:
+            return cached
+
+        me = text_to_mesh(char)
+        try:
+            extrude_mesh(me, 1.0)
+            arrays = mesh_arrays.mesh_to_arrays(me)
+        finally:
+            bpy.data.meshes.remove(me)
+        # The pen moves by the advance, so it is what a trailing H gets shifted by
+        advance = float(_text_x_max(char + "H") - _text_x_max("H"))
+
+        self._glyphs[char] = cached = (arrays, advance)
+        self._dirty = True
+        return cached
+
+    def warm(self, chars=GLYPH_ALPHABET):
+        for char in chars:
+            self.glyph(char)
+        self.line_height()
+
+    @staticmethod
+    def _concatenate(placed):
+        # placed: [(arrays, x, y)], indices are shifted past the glyphs before them
+        co, vertex_index, loop_start = [], [], []
+        vert_count = loop_count = 0
+        for arrays, x, y in placed:
+            co.append(arrays["co"] + np.array((x, y, 0.0), dtype=np.float32))
+            vertex_index.append(arrays["vertex_index"] + vert_count)
+            loop_start.append(arrays["loop_start"] + loop_count)
+            vert_count += len(arrays["co"])
+            loop_count += len(arrays["vertex_index"])
+        if not co:
+            return np.zeros((0, 3), np.float32), np.zeros(0, np.int32), np.zeros(0, np.int32)
+        return (np.concatenate(co).astype(np.float32),
+                np.concatenate(vertex_index).astype(np.int32),
+                np.concatenate(loop_start).astype(np.int32))
+
+    def text_arrays(self, body):
+        """Mesh arrays of ``body`` in font units, left aligned, lines going down."""
+        placed = []
+        for line_number, line in enumerate(body.split("\n")):
+            x, y = 0.0, -line_number * self.line_height()
+            for char in line:
+                arrays, advance = self.glyph(char)
+                if len(arrays["co"]):
+                    placed.append((arrays, x, y))
+                x += advance
+        return self._concatenate(placed)
+
+    def label_mesh(self, body, target_height, depth=LABEL_DEPTH, name="label.order"):
+        """Same result as text_to_mesh() followed by fit_and_extrude(), from cached glyphs."""
+        co, vertex_index, loop_start = self.text_arrays(body)
+        if not len(co):
+            raise ValueError("Label text has no geometry")
+
+        co = co.astype(np.float64)
+        low, high = co[:, :2].min(axis=0), co[:, :2].max(axis=0)
+        height = high[1] - low[1]
+        if height <= 0.0:
+            raise ValueError("Label text has no height")
+
+        scale_factor = target_height / height
+        center = (low + high) * 0.5
+        co[:, :2] = (co[:, :2] - center) * scale_factor
+        co[:, 2] *= depth
+
+        me = mesh_arrays.mesh_from_arrays(name, co, vertex_index, loop_start)
+        return me, Vector((center[0] * scale_factor, center[1] * scale_factor, 0.0))
+
+
+def frame_to_world(matrix_world, center, normal):
+    world_center = matrix_world @ Vector(center)
+    normal_matrix = matrix_world.to_3x3().inverted_safe().transposed()
+    world_normal = (normal_matrix @ Vector(normal)).normalized()
+    return world_center, world_normal
+
+
+def place_object(obj, world_center=None, world_normal=None):
+    if world_center is None:
+        return
+    obj.location = world_center
+    align_quat = Vector((0, 0, 1)).rotation_difference(world_normal)
+    obj.rotation_euler = align_quat.to_euler()
+
+
+def generate_order_label(collection, order_id, full_label=False, world_center=None, world_normal=None,
+                         glyphs=None):
+    """Build an extruded order ID label with the data API only.
+
+    No operators, mode switches or selection changes are involved. With a
+    GlyphCache as ``glyphs`` the text is assembled from cached characters.
+    """
+    body = label_body(order_id, full_label)
+    target_height = FULL_LABEL_HEIGHT if full_label else LABEL_HEIGHT
+    if glyphs is not None:
+        me, origin = glyphs.label_mesh(body, target_height)
+    else:
+        me = text_to_mesh(body)
+        try:
+            origin = fit_and_extrude(me, target_height)
+        except ValueError:
+            bpy.data.meshes.remove(me)
+            raise
+
+    label_obj = bpy.data.objects.new("label.order", me)
+    label_obj.location = origin
+    collection.objects.link(label_obj)
+    place_object(label_obj, world_center, world_normal)
+    return label_obj
+
+
+def _parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    if value is None or str(value).strip() == "":
+        return None
+    return str(value).strip().lower() in ("1", "true", "yes", "y", "full")
+
+
+def _parse_faces(value):
+    if value is None or value == "":
+        return []
+    if isinstance(value, (list, tuple)):
+        return [int(v) for v in value]
+    return [int(v) for v in str(value).replace(";", " ").replace(",", " ").split()]
+
+
+def _manifest_row(row):
+    # JSON entries may be bare order IDs, strings or numbers
+    if not isinstance(row, dict):
+        row = {"order_id": row}
+    row = dict(row)
+    order_id = row.get("order_id")
+    if order_id is not None:
+        if isinstance(order_id, bool) or not isinstance(order_id, (str, int)):
+            raise ValueError(f"Manifest entry {row!r} has no string or integer order ID")
+        row["order_id"] = str(order_id)
+    if not isinstance(row.get("target"), (str, type(None))):
+        raise ValueError(f"Manifest entry {row!r} has a target that is no object name")
+    return row
+
+
+def read_manifest(path):
+    """Read a CSV or JSON order manifest as a list of entries.
+
+    Every entry has ``order_id`` and optionally ``full_label`` (None keeps
+    the caller's default), ``target`` (object name) and ``faces`` (polygon
+    indices of the target to place the label on). CSV files need a header
+    with those column names; JSON is a list of entries or plain order IDs,
+    optionally under an ``"orders"`` key. Unreadable entries raise ValueError.
+    """
+    if os.path.splitext(path)[1].lower() == ".json":
+        with open(path, "r", encoding="utf-8") as f:
+            rows = json.load(f)
+        if isinstance(rows, dict):
+            rows = rows["orders"]
+        if not isinstance(rows, list):
+            raise ValueError(f"{path} holds no list of orders")
+        rows = [_manifest_row(row) for row in rows]
+    else:
+        with open(path, "r", encoding="utf-8-sig", newline="") as f:
+            rows = list(csv.DictReader(f))
+
+    entries = []
+    for row in rows:
+        order_id = str(row.get("order_id") or "").strip()
+        if not order_id:
+            continue
+        entries.append({
+            "order_id": order_id,
+            "full_label": _parse_bool(row.get("full_label")),
+            "target": (row.get("target") or "").strip() or None,
+            "faces": _parse_faces(row.get("faces")),
+        })
+    return entries
+
+
+def target_frame(obj, faces):
+    # World space placement on the given polygons of a mesh object
+    me = obj.data
+    vertex_index, loop_start = geometry.mesh_polygon_arrays(me)
+    faces = np.asarray(faces, dtype=np.int64)
+    invalid = faces[(faces < 0) | (faces >= len(loop_start))]
+    if len(invalid):
+        raise ValueError(f"{obj.name} has no face {invalid[0]}, it has {len(loop_start)} faces")
+    mask = np.zeros(len(loop_start), dtype=bool)
+    mask[faces] = True
+    frame = geometry.faces_frame(geometry.mesh_vertex_coords(me), vertex_index, loop_start, mask)
+    if frame is None:
+        return None, None
+    return frame_to_world(obj.matrix_world, *frame)
+
+
+def generate_labels_from_manifest(collection, entries, full_label=False, objects=None, glyphs=None):
+    """Generate one label per manifest entry, returns ``[(entry, obj or error)]``.
+
+    ``objects`` maps target names to objects, bpy.data.objects by default.
+    Labels without a target are laid out in a column below the origin.
+    """
+    objects = bpy.data.objects if objects is None else objects
+    results = []
+    row = 0
+    for entry in entries:
+        entry_full_label = full_label if entry["full_label"] is None else entry["full_label"]
+        world_center = world_normal = None
+
+        try:
+            if entry["target"]:
+                target = objects.get(entry["target"])
+                if target is None or target.type != 'MESH':
+                    raise ValueError(f"No mesh object named {entry['target']}")
+                if entry["faces"]:
+                    world_center, world_normal = target_frame(target, entry["faces"])
+
+            label_obj = generate_order_label(
+                collection, entry["order_id"], entry_full_label, world_center, world_normal, glyphs)
+        except (ValueError, IndexError) as e:
+            results.append((entry, e))
+            continue
+
+        if world_center is None:
+            height = FULL_LABEL_HEIGHT if entry_full_label else LABEL_HEIGHT
+            label_obj.location.y -= row
+            row += height + BATCH_SPACING
+        label_obj.name = f"label.{entry['order_id']}"
+        results.append((entry, label_obj))
+    return results
@@ -0,0 +1,220 @@
+import bisect
+import cProfile
+import functools
+import io
+import json
+import pstats
+import statistics
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+# Upper bucket edges in seconds, doubling from 0.1 ms to about 13 s
+BUCKET_EDGES = tuple(0.0001 * 2 ** i for i in range(18))
+# Calls kept per histogram
+WINDOW = 512
+
+# Blender checks the argument count of registered methods, so each one
+# gets a wrapper with the exact signature instead of *args
+TIMED_METHODS = {
+    "execute": ("context",),
+    "invoke": ("context", "event"),
+    "modal": ("context", "event"),
+    "draw": ("context",),
+}
+
+
+class RollingHistogram:
+    """Durations of the last ``window`` samples plus a count of all of them."""
+
+    def __init__(self, window=WINDOW):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+
+    def summary(self):
+        samples = sorted(self.samples)
+        if not samples:
+            return {"count": self.count, "total": self.total}
+
+        def percentile(p):
+            return samples[min(int(p * len(samples)), len(samples) - 1)]
+
+        buckets = [0] * (len(BUCKET_EDGES) + 1)
+        for seconds in samples:
+            buckets[bisect.bisect_left(BUCKET_EDGES, seconds)] += 1
+        return {
+            "count": self.count,
+            "total": self.total,
+            "mean": statistics.fmean(samples),
+            "p50": percentile(0.5),
+            "p90": percentile(0.9),
+            "p99": percentile(0.99),
+            "max": samples[-1],
+            "buckets": buckets,
+        }
+
+
+class Profiler:
+    """Per call wall time of operators and panels, split into phases.
+
+    Calls are keyed ``Class.method``. Code running inside a call marks its
+    phases (network, load, geometry) with phase(); phases outside of any
+    call, like background downloads, go under ``background``.
+    """
+
+    def __init__(self):
+        self.enabled = True
+        self.histograms = {}
+        self.capture_target = None
+        self.capture_armed = False
+        self.last_capture = None
+
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def record(self, key, phase, seconds):
+        with self._lock:
+            histogram = self.histograms.get((key, phase))
+            if histogram is None:
+                histogram = self.histograms[(key, phase)] = RollingHistogram()
+            histogram.add(seconds)
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {}
+
+    @contextmanager
+    def call(self, key):
+        if not self.enabled:
+            yield
+            return
+
+        stack = self._stack()
+        stack.append(key)
+        profile = None
+        if self.capture_armed and self._capture_matches(key):
+            self.capture_armed = False
+            profile = cProfile.Profile()
+            profile.enable()
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(key, "total", time.perf_counter() - start)
+            stack.pop()
+            if profile is not None:
+                profile.disable()
+                self._store_capture(key, profile)
+
+    @contextmanager
+    def phase(self, name):
+        if not self.enabled:
+            yield
+            return
+
+        stack = self._stack()
+        key = stack[-1] if stack else "background"
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(key, name, time.perf_counter() - start)
+
+    def capture_next(self, target=None):
+        """Run the next call of ``target`` (class name or key) under cProfile.
+
+        Without a target the next call that is not a panel draw is captured.
+        """
+        self.capture_target = target
+        self.capture_armed = True
+
+    def _capture_matches(self, key):
+        if not self.capture_target:
+            return not key.endswith(".draw")
+        return self.capture_target in (key, key.partition(".")[0])
+
+    def _store_capture(self, key, profile):
+        out = io.StringIO()
+        pstats.Stats(profile, stream=out).sort_stats("cumulative").print_stats(40)
+        self.last_capture = {"key": key, "time": time.time(), "stats": out.getvalue()}
+
+    def report(self):
+        # {key: {phase: summary}}, keys sorted by total time spent
+        with self._lock:
+            items = list(self.histograms.items())
+        calls = {}
+        for (key, phase), histogram in items:
+            calls.setdefault(key, {})[phase] = histogram.summary()
+        return dict(sorted(calls.items(), key=lambda item: -item[1].get("total", {}).get("total", 0.0)))
+
+    def export(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({
+                "bucket_edges": BUCKET_EDGES,
+                "calls": self.report(),
+                "capture": self.last_capture,
+            }, f, indent=1)
+
+    # class instrumentation
+
+    def _wrap(self, fn, key, args):
+        profiler = self
+
+        if args == ("context", "event"):
+            @functools.wraps(fn)
+            def wrapper(self, context, event):
+                with profiler.call(key):
+                    return fn(self, context, event)
+        else:
+            @functools.wraps(fn)
+            def wrapper(self, context):
+                with profiler.call(key):
+                    return fn(self, context)
+
+        wrapper._profiled = True
+        return wrapper
+
+    def instrument(self, cls):
+        for method, args in TIMED_METHODS.items():
+            # Only methods of the add-on itself, not the ones bpy base classes may carry
+            if not any(method in klass.__dict__ for klass in cls.__mro__ if klass.__module__ == cls.__module__):
+                continue
+            fn = getattr(cls, method)
+            if getattr(fn, "_profiled", False):
+                continue
+            wrapper = self._wrap(fn, f"{cls.__name__}.{method}", args)
+            # NOTE: remember whether the method was inherited so that it can be restored
+            wrapper._own = method in cls.__dict__
+            setattr(cls, method, wrapper)
+
+    def uninstrument(self, cls):
+        for method in TIMED_METHODS:
+            fn = cls.__dict__.get(method)
+            if fn is None or not getattr(fn, "_profiled", False):
+                continue
+            if fn._own:
+                setattr(cls, method, fn.__wrapped__)
+            else:
+                delattr(cls, method)
+
+
+profiler = Profiler()
+
+
+def format_ms(seconds):
+    return f"{seconds * 1000:.1f}"
@@ -1,15 +1,39 @@
 import bpy
 import inspect
+import logging
+import math
 import os
-import urllib.request
+import re
 import bmesh
+import numpy as np
 from mathutils import Vector
-import ssl
 import sys
+import threading
+import time
 
+from . import geometry, head_library, mesh_arrays, order_labels, thickness
+from .asset_cache import (AssetCache, AssetFetchJob, AssetUnavailableError, fetch_first, fresh_lookup_first,
+                          prefetch)
+from .profiling import format_ms, profiler
+
+
+log = logging.getLogger(__name__)
 
 S3_BUCKET = "https://s3.kigland.cn/blender"
 
+# Every component the generators can ask for
+ASSET_CATALOGUE = (
+    "logo.blend",
+    "ears.blend",
+    "lock_nrh.blend",
+    "eye_hole.blend",
+    "ref_head_a2.blend",
+    "ref_head_sizes.npz",
+)
+
+# Every GB/T size as offsets from ref_head_a2, see head_library
+HEAD_LIBRARY_FILENAME = "ref_head_sizes.npz"
+
 
 def clean_float(value: float, precision: int = 0) -> str:
     # Avoid scientific notation and strip trailing zeros: 0.000 -> 0.0
@@ -121,6 +145,15 @@ class PropsRealHeadSizes(bpy.types.PropertyGroup):
         items=head_type_items
     )
 
+    head_gen_mode: bpy.props.EnumProperty(
+        name="Head",
+        items=[
+            ('SCALE', "Scale A2", "Scale the A2 head along one measurement"),
+            ('SIZE', "GB/T Size", "The GB/T head of the chosen size"),
+            ('FIT', "Fit Measurements", "Blend the GB/T sizes to match height, width and circumference"),
+        ]
+    )
+
     head_gen_scale_by: bpy.props.EnumProperty(
         name="Scale By",
         items=[
@@ -154,6 +187,20 @@ class PropsRealHeadSizes(bpy.types.PropertyGroup):
         default=35.0
     )
 
+    measure_exact: bpy.props.BoolProperty(
+        name="Exact Bounds",
+        description="Measure the evaluated vertices instead of the local bounding boxes",
+        default=False
+    )
+
+class CostBatchEntry(bpy.types.PropertyGroup):
+    # name is inherited from PropertyGroup
+    volume: bpy.props.StringProperty(name="Volume")
+    weight: bpy.props.StringProperty(name="Weight")
+    cost: bpy.props.StringProperty(name="Cost")
+    support_cost: bpy.props.StringProperty(name="Support Cost")
+
+
 class CostMonitor(bpy.types.PropertyGroup):
     # unit 1.34 g/cm^3
     density: bpy.props.FloatProperty(
@@ -185,71 +232,781 @@ class CostMonitor(bpy.types.PropertyGroup):
         default="0 g"
     )    
 
+    volume_engine: bpy.props.EnumProperty(
+        name="Volume Engine",
+        items=[
+            ('NUMPY', "NumPy", "Signed tetrahedra over the evaluated loop triangles, no mesh copy"),
+            ('BMESH', "BMesh", "Triangulated BMesh copy, slow reference path"),
+        ]
+    )
+
+    batch_scope: bpy.props.EnumProperty(
+        name="Batch",
+        items=[
+            ('SELECTED', "Selected", "Every selected mesh"),
+            ('COLLECTION', "Collection", "Every mesh in a collection and its children"),
+            ('SCENE', "Scene", "Every mesh in the scene"),
+        ]
+    )
+
+    batch_collection: bpy.props.PointerProperty(
+        name="Collection",
+        type=bpy.types.Collection
+    )
+
+    batch_results: bpy.props.CollectionProperty(type=CostBatchEntry)
+
+    batch_total: bpy.props.StringProperty(
+        name="Batch Total",
+        default=""
+    )
+
+    live_update: bpy.props.BoolProperty(
+        name="Live Cost",
+        description="Recompute the active object's cost while it is being edited",
+        default=False
+    )
+
+    support_enabled: bpy.props.BoolProperty(
+        name="Estimate Supports",
+        description="Add the support material under overhangs to the cost",
+        default=False
+    )
+
+    support_overhang_angle: bpy.props.FloatProperty(
+        name="Overhang Angle",
+        description="Faces leaning out further than this from vertical need support",
+        subtype='ANGLE',
+        default=math.radians(45.0),
+        min=0.0,
+        max=math.radians(90.0)
+    )
+
+    support_build_direction: bpy.props.EnumProperty(
+        name="Build Direction",
+        description="Direction the part grows in while printing",
+        items=[
+            ('POS_Z', "+Z", "Printed upright"),
+            ('NEG_Z', "-Z", "Printed upside down"),
+            ('POS_Y', "+Y", ""),
+            ('NEG_Y', "-Y", ""),
+            ('POS_X', "+X", ""),
+            ('NEG_X', "-X", ""),
+        ]
+    )
+
+    support_infill: bpy.props.FloatProperty(
+        name="Support Infill",
+        description="Share of the space under overhangs that the supports fill",
+        subtype='FACTOR',
+        default=0.2,
+        min=0.01,
+        max=1.0
+    )
+
+    support_volume: bpy.props.StringProperty(
+        name="Support Volume",
+        default=""
+    )
+
+    support_weight: bpy.props.StringProperty(
+        name="Support Weight",
+        default=""
+    )
+
+    support_cost: bpy.props.StringProperty(
+        name="Support Cost",
+        default=""
+    )
+
+    total_cost: bpy.props.StringProperty(
+        name="Cost with Supports",
+        default=""
+    )
+
+    thickness_min: bpy.props.FloatProperty(
+        name="Min Wall (mm)",
+        description="Faces with a thinner wall behind them are marked red",
+        default=1.5,
+        min=0.0
+    )
+
+    thickness_max_distance: bpy.props.FloatProperty(
+        name="Max Ray (mm)",
+        description="Walls thicker than this are not measured further",
+        default=20.0,
+        min=0.01
+    )
+
+    thickness_max_samples: bpy.props.IntProperty(
+        name="Samples",
+        description="Faces to cast rays from, picked at random, 0 for every face",
+        default=200000,
+        min=0
+    )
+
+    thickness_summary: bpy.props.StringProperty(
+        name="Wall Thickness",
+        default=""
+    )
+
+
+class PrefsToolbox(bpy.types.AddonPreferences):
+    bl_idname = __package__
+
+    cache_dir: bpy.props.StringProperty(
+        name="Asset Cache Dir",
+        description="Where downloaded components are kept, empty for the default location",
+        subtype='DIR_PATH',
+        default=""
+    )
+
+    cache_size_limit: bpy.props.IntProperty(
+        name="Cache Size Limit (MB)",
+        description="Least recently used assets are evicted above this size, 0 for no limit",
+        default=1024,
+        min=0
+    )
+
+    cache_revalidate_after: bpy.props.IntProperty(
+        name="Revalidate After (min)",
+        description="Cached assets younger than this are used without asking the server",
+        default=60,
+        min=0
+    )
+
+    offline_mode: bpy.props.BoolProperty(
+        name="Offline Mode",
+        description="Never touch the network, only use cached assets",
+        default=False
+    )
+
+    network_timeout: bpy.props.FloatProperty(
+        name="Timeout (s)",
+        description="Give up on a connection that stays silent this long",
+        default=30.0,
+        min=1.0
+    )
+
+    network_retries: bpy.props.IntProperty(
+        name="Retries",
+        description="Retries with jittered backoff on connection errors and busy servers",
+        default=3,
+        min=0,
+        max=10
+    )
+
+    prefer_npz_assets: bpy.props.BoolProperty(
+        name="Prefer NumPy Assets",
+        description="Load components from the compact .npz format when the server has one",
+        default=True
+    )
+
+    reuse_components: bpy.props.BoolProperty(
+        name="Reuse Component Meshes",
+        description="New components share the mesh of one already in the file instead of appending a copy",
+        default=True
+    )
+
+    verify_ssl: bpy.props.BoolProperty(
+        name="Verify Certificates",
+        description="Check the S3 server certificate, only turn off behind a broken proxy",
+        default=True
+    )
+
+    cache_label_glyphs: bpy.props.BoolProperty(
+        name="Keep Label Glyphs",
+        description="Store the converted label characters on disk so later sessions skip the font conversion",
+        default=True
+    )
+
+    prefetch_on_register: bpy.props.BoolProperty(
+        name="Warm Cache On Startup",
+        description="Download the whole component catalogue in the background when the add-on loads",
+        default=False
+    )
+
+    prefetch_workers: bpy.props.IntProperty(
+        name="Parallel Downloads",
+        default=4,
+        min=1,
+        max=16
+    )
+
+    record_timings: bpy.props.BoolProperty(
+        name="Record Timings",
+        description="Time every operator and panel of the toolbox, see the Debug Timings panel",
+        default=True,
+        update=lambda self, context: setattr(profiler, "enabled", self.record_timings)
+    )
+
+    def draw(self, context):
+        layout = self.layout
+
+        layout.row().label(text="Asset Cache", icon='FILE_CACHE')
+        layout.row().prop(self, "cache_dir")
+        layout.row().prop(self, "cache_size_limit")
+        layout.row().prop(self, "cache_revalidate_after")
+        layout.row().prop(self, "offline_mode")
+        layout.row().prop(self, "reuse_components")
+        layout.row().prop(self, "prefer_npz_assets")
+        layout.row().prop(self, "cache_label_glyphs")
+
+        layout.row().label(text="Network", icon='URL')
+        layout.row().prop(self, "network_timeout")
+        layout.row().prop(self, "network_retries")
+        layout.row().prop(self, "verify_ssl")
+        layout.row().prop(self, "prefetch_on_register")
+        layout.row().prop(self, "prefetch_workers")
+        layout.row().prop(self, "record_timings")
+
+        cache = get_asset_cache()
+        layout.row().label(text=f"In use: {cache.total_size() / (1024 * 1024):.1f} MB")
+        layout.row().operator(OpWarmAssetCache.bl_idname)
+        layout.row().operator(OpClearAssetCache.bl_idname)
+        layout.row().operator(OpExportComponentNpz.bl_idname)
+        layout.row().operator(OpBuildHeadLibrary.bl_idname)
+
+
+def get_preferences():
+    addon = bpy.context.preferences.addons.get(__package__)
+    return addon.preferences if addon else None
+
+
+_asset_cache = None
+
+
+def get_asset_cache():
+    global _asset_cache
+
+    prefs = get_preferences()
+    cache_dir = prefs.cache_dir if prefs and prefs.cache_dir else \
+        bpy.utils.user_resource('DATAFILES', path="kigland_toolbox/asset_cache", create=True)
+    cache_dir = bpy.path.abspath(cache_dir)
+
+    if _asset_cache is None or _asset_cache.root != cache_dir:
+        _asset_cache = AssetCache(cache_dir)
+
+    if prefs:
+        _asset_cache.max_bytes = prefs.cache_size_limit * 1024 * 1024
+        _asset_cache.max_age = prefs.cache_revalidate_after * 60.0
+        _asset_cache.offline = prefs.offline_mode
+        _asset_cache.transport.timeout = prefs.network_timeout
+        _asset_cache.transport.retries = prefs.network_retries
+        _asset_cache.transport.verify = prefs.verify_ssl
+
+    return _asset_cache
 
-def download_file_and_load(url, temp_dir, blend_filename):
-    loaded_objects = []
-    temp_blend_path = os.path.join(temp_dir, blend_filename)
 
-    # NOTE: WARNING it will not verify cert
-    context = ssl._create_unverified_context()
+_glyph_cache = None
 
-    with urllib.request.urlopen(url, context=context) as response:
-        with open(temp_blend_path, 'wb') as out_file:
-            out_file.write(response.read())
 
-    if os.path.exists(temp_blend_path):
-        with bpy.data.libraries.load(temp_blend_path, link=False) as (data_from, data_to):
-            data_to.objects = [name for name in data_from.objects if name]
+def get_glyph_cache():
+    global _glyph_cache
 
-        for obj in data_to.objects:
-            if obj is not None:
-                bpy.context.collection.objects.link(obj)
-                loaded_objects.append(obj)
+    prefs = get_preferences()
+    path = None
+    if prefs is None or prefs.cache_label_glyphs:
+        path = os.path.join(
+            bpy.utils.user_resource('DATAFILES', path="kigland_toolbox", create=True), "label_glyphs.npz")
 
-    if os.path.exists(temp_blend_path):
-        os.remove(temp_blend_path)
+    if _glyph_cache is None or _glyph_cache.path != path:
+        _glyph_cache = order_labels.GlyphCache(path)
+    return _glyph_cache
+
+
+def load_blend_objects(blend_path):
+    loaded_objects = []
+
+    with bpy.data.libraries.load(blend_path, link=False) as (data_from, data_to):
+        data_to.objects = [name for name in data_from.objects if name]
+
+    for obj in data_to.objects:
+        if obj is not None:
+            bpy.context.collection.objects.link(obj)
+            loaded_objects.append(obj)
 
     return loaded_objects
 
 
-def get_active_vertex_location():
-    obj = bpy.context.edit_object
-    if obj is None:
-        return None
+def asset_urls(asset_filename):
+    # Candidate URLs for a component, best format first
+    urls = [f"{S3_BUCKET}/{asset_filename}"]
+    prefs = get_preferences()
+    if asset_filename.endswith(".npz"):
+        return tuple(urls)
+    if prefs is None or prefs.prefer_npz_assets:
+        urls.insert(0, f"{S3_BUCKET}/{os.path.splitext(asset_filename)[0]}.npz")
+    return tuple(urls)
 
-    bm = bmesh.from_edit_mesh(obj.data)
 
-    active_vert = bm.select_history.active
+def load_asset_objects(path):
+    if path.endswith(".npz"):
+        return mesh_arrays.load_npz_objects(path, bpy.context.collection)
+    return load_blend_objects(path)
 
-    if isinstance(active_vert, bmesh.types.BMVert) and active_vert.select:
-        # Apply the object's world matrix to the active vertex's coordinate
-        return obj.matrix_world @ active_vert.co
-    else:
-        return None
 
+class ComponentRegistry:
+    # Finds component meshes that are already in bpy.data, so placing the
+    # same component again only costs a new object sharing that mesh.
+    # The bookkeeping lives in custom properties on the meshes, which keeps
+    # it valid across undo and file reloads.
 
-def get_average_location_of_selected_verts():
-    obj = bpy.context.edit_object
-    if obj is None:
-        return None
+    ASSET_KEY = "kigland_asset"
+    PART_KEY = "kigland_part"
+    PARTS_KEY = "kigland_parts"
+    NAME_KEY = "kigland_name"
+    MATRIX_KEY = "kigland_matrix"
+
+    def register(self, asset_filename, loaded_objects):
+        # Objects with modifiers can not be rebuilt from the mesh alone
+        if not loaded_objects or any(obj.type != 'MESH' or obj.modifiers for obj in loaded_objects):
+            return False
+
+        for i, obj in enumerate(loaded_objects):
+            me = obj.data
+            me[self.ASSET_KEY] = asset_filename
+            me[self.PART_KEY] = i
+            me[self.PARTS_KEY] = len(loaded_objects)
+            me[self.NAME_KEY] = obj.name
+            me[self.MATRIX_KEY] = [v for row in obj.matrix_basis for v in row]
+        return True
+
+    def parts(self, asset_filename):
+        parts = {}
+        for me in bpy.data.meshes:
+            if me.get(self.ASSET_KEY) == asset_filename:
+                parts.setdefault(me[self.PART_KEY], me)
+
+        if not parts or len(parts) != next(iter(parts.values()))[self.PARTS_KEY]:
+            return None
+        return [parts[i] for i in sorted(parts)]
+
+    def instantiate(self, context, asset_filename):
+        meshes = self.parts(asset_filename)
+        if meshes is None:
+            return None
+
+        objects = []
+        for me in meshes:
+            obj = bpy.data.objects.new(me[self.NAME_KEY], me)
+            matrix = list(me[self.MATRIX_KEY])
+            obj.matrix_basis = [matrix[i:i + 4] for i in range(0, 16, 4)]
+            context.collection.objects.link(obj)
+            objects.append(obj)
+        return objects
+
+    def make_single_user(self, obj):
+        me = obj.data.copy()
+        for key in (self.ASSET_KEY, self.PART_KEY, self.PARTS_KEY, self.NAME_KEY, self.MATRIX_KEY):
+            if key in me:
+                del me[key]
+        obj.data = me
+
+
+component_registry = ComponentRegistry()
+
+
+# Fetches that are running in the background, shown in the components panel
+asset_fetch_jobs = []
+
+
+def tag_redraw_view3d(context):
+    if context.screen is None:
+        return
+    for area in context.screen.areas:
+        if area.type == 'VIEW_3D':
+            area.tag_redraw()
+
+
+class AssetGenMixin:
+    # Generator operators that need a component from S3_BUCKET.
+    # execute() blocks (scripts, headless), invoke() downloads on a worker
+    # thread and loads the objects on the main thread once the file arrived.
+    # Files listed by extra_assets() go through the same workers, place()
+    # reads them from the cache with asset_path().
+
+    asset_filename = ""
+    # Set when place() edits the mesh itself, shared component meshes are copied first
+    single_user = False
+
+    def prepare(self, context):
+        # Capture whatever the placement needs at click time
+        pass
+
+    def place(self, context, loaded_objects):
+        pass
+
+    def asset_urls(self):
+        return asset_urls(self.asset_filename)
+
+    def reuse_components(self):
+        prefs = get_preferences()
+        return prefs.reuse_components if prefs else True
+
+    def extra_assets(self):
+        # Other files place() needs, fetched together with the component
+        return ()
+
+    def asset_path(self, asset_filename):
+        # Local path of one of extra_assets(), raises AssetUnavailableError
+        path = self._extra_paths.get(asset_filename)
+        if path is None:
+            raise AssetUnavailableError(f"{asset_filename} was not fetched")
+        if isinstance(path, Exception):
+            raise path
+        return path
+
+    def fetch_extra_assets(self):
+        # Blocking, the network is only used for files that are not fresh in the cache
+        self._extra_paths = {}
+        for filename in self.extra_assets():
+            try:
+                with profiler.phase("network"):
+                    self._extra_paths[filename] = fetch_first(get_asset_cache(), asset_urls(filename))
+            except AssetUnavailableError as e:
+                self._extra_paths[filename] = e
+
+    def component_ready(self, cache):
+        # True when the component can be placed without the network
+        if self.reuse_components() and component_registry.parts(self.asset_filename) is not None:
+            return True
+        return fresh_lookup_first(cache, self.asset_urls()) is not None
+
+    def load_component(self, context):
+        # Shared meshes already in the file, else the file from the cache or the network
+        loaded_objects = None
+        if self.reuse_components():
+            with profiler.phase("load"):
+                loaded_objects = component_registry.instantiate(context, self.asset_filename)
+        if loaded_objects is None:
+            with profiler.phase("network"):
+                path = fetch_first(get_asset_cache(), self.asset_urls())
+            loaded_objects = self.load(path)
+        return loaded_objects
+
+    def finish(self, context, loaded_objects):
+        if self.single_user:
+            for obj in loaded_objects:
+                if obj.type == 'MESH':
+                    component_registry.make_single_user(obj)
+        with profiler.phase("geometry"):
+            self.place(context, loaded_objects)
+        return {'FINISHED'}
+
+    def load(self, path):
+        with profiler.phase("load"):
+            loaded_objects = load_asset_objects(path)
+        if self.reuse_components():
+            component_registry.register(self.asset_filename, loaded_objects)
+        return loaded_objects
+
+    def execute(self, context):
+        self.prepare(context)
+        return self.run(context)
+
+    def run(self, context):
+        # Blocking placement once prepare() has run
+        self.fetch_extra_assets()
+        try:
+            loaded_objects = self.load_component(context)
+        except AssetUnavailableError as e:
+            self.report({'ERROR'}, str(e))
+            return {'CANCELLED'}
+        return self.finish(context, loaded_objects)
+
+    def invoke(self, context, event):
+        cache = get_asset_cache()
+        self.prepare(context)
+        component_ready = self.component_ready(cache)
+        extras = [filename for filename in self.extra_assets()
+                  if fresh_lookup_first(cache, asset_urls(filename)) is None]
+        if component_ready and not extras:
+            return self.run(context)
+
+        self._fetch_started = time.perf_counter()
+        self._job = None if component_ready else AssetFetchJob(cache, *self.asset_urls()).start()
+        self._extra_jobs = {filename: AssetFetchJob(cache, *asset_urls(filename)).start() for filename in extras}
+        asset_fetch_jobs.extend(self.jobs())
+
+        wm = context.window_manager
+        self._timer = wm.event_timer_add(0.1, window=context.window)
+        wm.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+    def jobs(self):
+        return [job for job in (self._job, *self._extra_jobs.values()) if job is not None]
+
+    def modal(self, context, event):
+        jobs = self.jobs()
+
+        if event.type == 'ESC' and event.value == 'PRESS':
+            for job in jobs:
+                job.cancel()
+
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+
+        cancelled = next((job for job in jobs if job.cancelled), None)
+        if cancelled is not None:
+            self.cleanup(context)
+            self.report({'WARNING'}, f"Download of {cancelled.name} cancelled")
+            return {'CANCELLED'}
+
+        running = next((job for job in jobs if not job.finished), None)
+        if running is not None:
+            context.workspace.status_text_set(
+                f"Downloading {running.name}: {running.fraction * 100:.0f}% (Esc to cancel)")
+            tag_redraw_view3d(context)
+            return {'PASS_THROUGH'}
+
+        self.cleanup(context)
+        # NOTE: the downloads ran on worker threads, their wall time counts as the network phase
+        profiler.record(f"{type(self).__name__}.modal", "network", time.perf_counter() - self._fetch_started)
+
+        # Everything is on disk now, nothing below waits for the network
+        cache = get_asset_cache()
+        self._extra_paths = {}
+        for filename in self.extra_assets():
+            job = self._extra_jobs.get(filename)
+            if job is not None:
+                self._extra_paths[filename] = job.path if job.error is None else job.error
+            else:
+                self._extra_paths[filename] = next(
+                    filter(None, (cache.lookup(url) for url in asset_urls(filename))), None)
+
+        if self._job is None:
+            try:
+                loaded_objects = self.load_component(context)
+            except AssetUnavailableError as e:
+                self.report({'ERROR'}, str(e))
+                return {'CANCELLED'}
+        elif self._job.error is not None:
+            self.report({'ERROR'}, str(self._job.error))
+            return {'CANCELLED'}
+        else:
+            loaded_objects = self.load(self._job.path)
+        return self.finish(context, loaded_objects)
+
+    def cleanup(self, context):
+        context.window_manager.event_timer_remove(self._timer)
+        context.workspace.status_text_set(None)
+        for job in self.jobs():
+            if job in asset_fetch_jobs:
+                asset_fetch_jobs.remove(job)
+        tag_redraw_view3d(context)
+
+
+class OpMakeComponentSingleUser(bpy.types.Operator):
+    bl_idname = "object.make_component_single_user"
+    bl_label = "Make Single User"
+    bl_description = "Give the selected components their own mesh so they can be edited alone"
+
+    def execute(self, context):
+        count = 0
+        for obj in context.selected_objects:
+            if obj.type == 'MESH' and obj.data.users > 1:
+                component_registry.make_single_user(obj)
+                count += 1
+        self.report({'INFO'}, f"{count} object(s) made single user")
+        return {'FINISHED'}
+
+
+class OpCancelAssetFetches(bpy.types.Operator):
+    bl_idname = "object.cancel_asset_fetches"
+    bl_label = "Cancel Downloads"
+
+    def execute(self, context):
+        for job in asset_fetch_jobs:
+            job.cancel()
+        return {'FINISHED'}
+
+
+_prefetch_thread = None
+
+
+def prefetch_in_background():
+    global _prefetch_thread
+
+    if _prefetch_thread is not None and _prefetch_thread.is_alive():
+        return False
+
+    cache = get_asset_cache()
+    prefs = get_preferences()
+    workers = prefs.prefetch_workers if prefs else 4
+    urls = [asset_urls(filename) for filename in ASSET_CATALOGUE]
+
+    def run():
+        for url, result in prefetch(cache, urls, max_workers=workers).items():
+            if isinstance(result, Exception):
+                log.warning("prefetch of %s failed: %s", url, result)
+
+    _prefetch_thread = threading.Thread(target=run, name="kigland prefetch", daemon=True)
+    _prefetch_thread.start()
+    return True
+
+
+def is_prefetching():
+    return _prefetch_thread is not None and _prefetch_thread.is_alive()
+
+
+class OpWarmAssetCache(bpy.types.Operator):
+    bl_idname = "object.warm_asset_cache"
+    bl_label = "Warm Cache"
+    bl_description = "Download every component in the background so the generators start instantly"
+
+    def execute(self, context):
+        if prefetch_in_background():
+            self.report({'INFO'}, f"Warming cache with {len(ASSET_CATALOGUE)} components")
+        else:
+            self.report({'INFO'}, "Cache is already being warmed")
+        return {'FINISHED'}
 
-    bm = bmesh.from_edit_mesh(obj.data)
-    selected_verts = [v for v in bm.verts if v.select]
 
-    if not selected_verts:
+class OpExportComponentNpz(bpy.types.Operator):
+    bl_idname = "object.export_component_npz"
+    bl_label = "Export Selected as .npz"
+    bl_description = "Write the selected meshes in the compact component format"
+
+    filepath: bpy.props.StringProperty(subtype='FILE_PATH')
+    filter_glob: bpy.props.StringProperty(default="*.npz", options={'HIDDEN'})
+
+    def invoke(self, context, event):
+        context.window_manager.fileselect_add(self)
+        return {'RUNNING_MODAL'}
+
+    def execute(self, context):
+        objects = [obj for obj in context.selected_objects if obj.type == 'MESH']
+        if not objects:
+            self.report({'ERROR'}, "No mesh selected")
+            return {'CANCELLED'}
+
+        filepath = bpy.path.ensure_ext(self.filepath, ".npz")
+        mesh_arrays.save_npz_objects(filepath, objects)
+        self.report({'INFO'}, f"Saved {len(objects)} mesh(es) to {filepath}")
+        return {'FINISHED'}
+
+
+class OpClearAssetCache(bpy.types.Operator):
+    bl_idname = "object.clear_asset_cache"
+    bl_label = "Clear Asset Cache"
+
+    def execute(self, context):
+        get_asset_cache().clear()
+        return {'FINISHED'}
+
+
+class SelectionState:
+    def __init__(self, vert_count, face_count, active_co=None, centroid=None):
+        self.vert_count = vert_count
+        self.face_count = face_count
+        # World space, None until computed or without selection
+        self.active_co = active_co
+        self.centroid = centroid
+
+
+class SelectionStateCache:
+    # Edit mode selection summary shared by every panel. draw() only reads
+    # the cheap selection counts; the active vertex and centroid are computed
+    # once per change in a timer, because update_from_editmode() can not run
+    # while drawing.
+
+    def __init__(self):
+        self._key = None
+        self._state = None
+        self._dirty = True
+        self._scheduled = False
+        # Set by refresh() when its update_from_editmode() will cause a depsgraph update
+        self._own_update = False
+
+    @property
+    def dirty(self):
+        return self._dirty
+
+    def reset(self):
+        # Forget everything, the pointers in the key may be reused by another file
+        self._key = self._state = None
+        self._dirty = True
+        self._own_update = False
+
+    def invalidate(self, obj=None):
+        if self._own_update:
+            self._own_update = False
+            # A real change landing in the same evaluation shows in the selection or the transform
+            if obj is None or self._make_key(obj) == self._key:
+                return
+        self._dirty = True
+
+    def _make_key(self, obj):
+        me = obj.data
+        return (obj.as_pointer(), me.total_vert_sel, me.total_face_sel,
+                tuple(v for row in obj.matrix_world for v in row))
+
+    def get(self, context):
+        obj = context.edit_object
+        if obj is None or obj.type != 'MESH':
+            return None
+
+        key = self._make_key(obj)
+        if self._dirty or key != self._key:
+            if not self._scheduled:
+                self._scheduled = True
+                bpy.app.timers.register(refresh_selection_state, first_interval=0.0)
+            me = obj.data
+            if self._state is None or self._key is None or self._key[0] != key[0]:
+                return SelectionState(me.total_vert_sel, me.total_face_sel)
+            # Counts are exact, locations are one refresh behind
+            return SelectionState(me.total_vert_sel, me.total_face_sel,
+                                  self._state.active_co, self._state.centroid)
+        return self._state
+
+    def refresh(self):
+        self._scheduled = False
+        obj = bpy.context.edit_object
+        if obj is None or obj.type != 'MESH':
+            self._state = self._key = None
+            return None
+
+        me = obj.data
+        bm = bmesh.from_edit_mesh(me)
+        active_vert = bm.select_history.active
+        active_co = None
+        if isinstance(active_vert, bmesh.types.BMVert) and active_vert.select:
+            active_co = obj.matrix_world @ active_vert.co
+
+        centroid = None
+        if me.total_vert_sel:
+            obj.update_from_editmode()
+            self._own_update = True
+            local = geometry.selected_vertex_centroid(me)
+            if local is not None:
+                centroid = obj.matrix_world @ Vector(local)
+
+        self._key = self._make_key(obj)
+        self._state = SelectionState(me.total_vert_sel, me.total_face_sel, active_co, centroid)
+        self._dirty = False
+        tag_redraw_view3d(bpy.context)
         return None
 
-    # Initialize a zero vector for accumulating vertex coordinates
-    avg_co = Vector((0.0, 0.0, 0.0))
 
-    # Sum the coordinates of all selected vertices
-    for vert in selected_verts:
-        avg_co += obj.matrix_world @ vert.co
+selection_state = SelectionStateCache()
+
 
-    # Divide by the number of selected vertices to get the average
-    avg_co /= len(selected_verts)
+def refresh_selection_state():
+    # NOTE: a plain function, so unregister() can find the timer again
+    return selection_state.refresh()
 
-    return avg_co
+
+@bpy.app.handlers.persistent
+def selection_state_depsgraph_update(scene, depsgraph):
+    obj = bpy.context.edit_object
+    if obj is None or selection_state.dirty:
+        # NOTE: already waiting for a refresh, nothing to look at until it ran
+        return
+    for update in depsgraph.updates:
+        if update.id.original in (obj, obj.data):
+            selection_state.invalidate(obj if obj.type == 'MESH' else None)
+            return
 
 
 class OpInitEnvUnitSettings(bpy.types.Operator):
@@ -269,50 +1026,172 @@ class OpInitEnvUnitSettings(bpy.types.Operator):
         return {'FINISHED'}
 
 
-class OpGenLogo(bpy.types.Operator):
+class OpGenLogo(AssetGenMixin, bpy.types.Operator):
     bl_idname = "object.gen_kigland_logo"
     bl_label = "Gen Logo"
 
-    def execute(self, context):
-        download_file_and_load(
-            f"{S3_BUCKET}/logo.blend",
-            bpy.app.tempdir,
-            "logo.blend"
-        )
-        return {'FINISHED'}
+    asset_filename = "logo.blend"
+
+
+_head_library = (None, None)
+
+
+def get_head_library(path):
+    # Kept loaded for as long as the cached file does not change
+    global _head_library
 
+    if _head_library[0] != path:
+        _head_library = (path, head_library.load_library(path))
+    return _head_library[1]
 
-class OpGenGBTHead(bpy.types.Operator):
+
+class OpGenGBTHead(AssetGenMixin, bpy.types.Operator):
     bl_idname = "object.gen_gbt_head"
     bl_label = "Gen GB/T Head Model"
 
-    def execute(self, context):
-        current_head = download_file_and_load(
-            f"{S3_BUCKET}/ref_head_a2.blend",
-            bpy.app.tempdir,
-            "ref_head_a2.blend"
-        )
+    asset_filename = "ref_head_a2.blend"
 
+    def prepare(self, context):
         head_data = context.scene.head_data
-        scale_property = 'head_height' if head_data.head_gen_scale_by == 'SCALE_BY_HEIGHT' else 'head_width'
-        scale_target = getattr(head_data, scale_property)
-        scale_factor = scale_target / current_head[0].dimensions.z
+        self.mode = head_data.head_gen_mode
+        self.head_type = head_data.head_type
+        self.measurements = (head_data.head_height, head_data.head_width, head_data.head_circumference)
+        # Sizes are written into the mesh, the shared A2 mesh must stay as it is
+        self.single_user = self.mode != 'SCALE'
+
+    def extra_assets(self):
+        return () if self.mode == 'SCALE' else (HEAD_LIBRARY_FILENAME,)
+
+    def place(self, context, current_head):
+        if self.mode == 'SCALE':
+            head_data = context.scene.head_data
+            scale_property = 'head_height' if head_data.head_gen_scale_by == 'SCALE_BY_HEIGHT' else 'head_width'
+            scale_target = getattr(head_data, scale_property)
+            scale_factor = scale_target / current_head[0].dimensions.z
+
+            current_head[0].scale *= scale_factor
+            return
+
+        try:
+            with profiler.phase("load"):
+                library = get_head_library(self.asset_path(HEAD_LIBRARY_FILENAME))
+        except (AssetUnavailableError, ValueError) as e:
+            self.report({'ERROR'}, f"Head sizes not available: {e}")
+            return
+
+        obj = current_head[0]
+        me = obj.data
+        if len(me.vertices) != library.vertex_count:
+            self.report({'ERROR'}, "Head sizes do not match the reference head")
+            return
+
+        if self.mode == 'SIZE':
+            if self.head_type not in library.sizes:
+                self.report({'ERROR'}, f"No {self.head_type} head in the size library")
+                return
+            weights, scale = library.size_weights(self.head_type), (1.0, 1.0, 1.0)
+        else:
+            weights, scale = library.fit(*self.measurements)
+
+        co = library.blend(geometry.mesh_vertex_coords(me), weights)
+        me.vertices.foreach_set("co", co.astype(np.float32).reshape(-1))
+        me.update()
+        obj.scale = [axis * factor for axis, factor in zip(obj.scale, scale)]
+
 
-        current_head[0].scale *= scale_factor
+def scene_to_mm(scene):
+    # mm per scene unit, scene units are taken as mm without a unit system
+    unit = scene.unit_settings
+    return unit.scale_length * 1000.0 if unit.system != 'NONE' else 1.0
 
+
+class OpMeasureHead(bpy.types.Operator):
+    bl_idname = "object.measure_head"
+    bl_label = "Measure Head Scan"
+    bl_description = "Fill in head height, width and circumference from the active head scan"
+
+    @classmethod
+    def poll(cls, context):
+        obj = context.active_object
+        return obj is not None and obj.type == 'MESH'
+
+    def execute(self, context):
+        obj = context.active_object
+        head_data = context.scene.head_data
+
+        start = time.perf_counter()
+        with profiler.phase("geometry"):
+            with geometry.evaluated_mesh(obj, context.evaluated_depsgraph_get()) as me:
+                if len(me.vertices) < 4:
+                    self.report({'ERROR'}, "Head scan has no geometry")
+                    return {'CANCELLED'}
+                co = geometry.transform_points(geometry.mesh_vertex_coords(me), obj.matrix_world)
+                height, width, circumference = geometry.head_measures(co, geometry.mesh_edge_array(me))
+
+        to_mm = scene_to_mm(context.scene)
+        head_data.head_height = height * to_mm
+        head_data.head_width = width * to_mm
+        head_data.head_circumference = circumference * to_mm
+
+        self.report({'INFO'}, f"H {head_data.head_height:.1f} W {head_data.head_width:.1f} "
+                              f"C {head_data.head_circumference:.1f} mm in {time.perf_counter() - start:.2f} s")
         return {'FINISHED'}
 
 
-class OpGenEyesHole(bpy.types.Operator):
+class OpBuildHeadLibrary(bpy.types.Operator):
+    bl_idname = "object.build_head_library"
+    bl_label = "Build Head Size Library"
+    bl_description = ("Write the selected GB/T heads as offsets from the A2 head. "
+                      "Object names must contain their size, like head_A5, and all heads share one topology")
+
+    filepath: bpy.props.StringProperty(subtype='FILE_PATH')
+    filter_glob: bpy.props.StringProperty(default="*.npz", options={'HIDDEN'})
+
+    def invoke(self, context, event):
+        context.window_manager.fileselect_add(self)
+        return {'RUNNING_MODAL'}
+
+    def execute(self, context):
+        heads = {}
+        for obj in context.selected_objects:
+            match = re.search(r"A[2-8]", obj.name)
+            if obj.type == 'MESH' and match:
+                heads[match.group(0)] = obj
+        if "A2" not in heads:
+            self.report({'ERROR'}, "Select the A2 head and the other sizes")
+            return {'CANCELLED'}
+
+        sizes = sorted(heads, key=lambda size: int(size[1:]))
+        # Measures are stored in mm, the unit of head_data they are fitted to
+        to_mm = scene_to_mm(context.scene)
+        coords, measures = [], []
+        for size in sizes:
+            obj = heads[size]
+            co = geometry.mesh_vertex_coords(obj.data)
+            coords.append(co)
+            measures.append(tuple(value * to_mm for value in geometry.head_measures(
+                geometry.transform_points(co, obj.matrix_world), geometry.mesh_edge_array(obj.data))))
+
+        try:
+            library = head_library.build_library(coords[0], sizes, coords, measures)
+        except ValueError as e:
+            self.report({'ERROR'}, str(e))
+            return {'CANCELLED'}
+
+        filepath = bpy.path.ensure_ext(self.filepath, ".npz")
+        head_library.save_library(filepath, library)
+        self.report({'INFO'}, f"Saved {', '.join(sizes)} to {filepath}")
+        return {'FINISHED'}
+
+
+class OpGenEyesHole(AssetGenMixin, bpy.types.Operator):
     bl_idname = "object.gen_eyes_hole"
     bl_label = "Gen Eyes Hole"
 
-    def execute(self, context):
-        eye_hole = download_file_and_load(
-            f"{S3_BUCKET}/eye_hole.blend",
-            bpy.app.tempdir,
-            "eye_hole.blend"
-        )
+    asset_filename = "eye_hole.blend"
+    single_user = True
+
+    def place(self, context, eye_hole):
         head_data = context.scene.head_data
         eye_spacing = head_data.eyes_spacing
 
@@ -323,21 +1202,13 @@ class OpGenEyesHole(bpy.types.Operator):
         
         mirror_modifier = eye_hole[0].modifiers.new(name="Mirror", type='MIRROR')
         mirror_modifier.use_axis[0] = True
-        
-        return {'FINISHED'}
 
 
-class OpGenEars(bpy.types.Operator):
+class OpGenEars(AssetGenMixin, bpy.types.Operator):
     bl_idname = "object.gen_kigland_ears"
     bl_label = "Gen Ears"
 
-    def execute(self, context):
-        download_file_and_load(
-            f"{S3_BUCKET}/ears.blend",
-            bpy.app.tempdir,
-            "ears.blend"
-        )
-        return {'FINISHED'}
+    asset_filename = "ears.blend"
 
 
 class OpRemoveObjectAllVertexGroups(bpy.types.Operator):
@@ -365,81 +1236,118 @@ class OpRemoveObjectAllShapeKeys(bpy.types.Operator):
         return {'FINISHED'}
 
 
+def apply_shape_keys_with_ops(obj):
+    # Works for any key setup but every operator call evaluates the mesh again
+    bpy.context.view_layer.objects.active = obj
+    shape_key_data = obj.data.shape_keys
+    key_blocks = shape_key_data.key_blocks
+    active_shape_key_index = obj.active_shape_key_index
+
+    bpy.ops.object.shape_key_add(from_mix=True)
+    obj.active_shape_key_index = len(key_blocks)
+
+    for i, key_block in reversed(list(enumerate(key_blocks))):
+        if i != active_shape_key_index:
+            obj.active_shape_key_index = i
+            bpy.ops.object.shape_key_remove(all=False)
+    for key_block in key_blocks:
+        obj.shape_key_remove(key_block)
+
+
+def bake_shape_keys(obj):
+    """Write the shape key mix into the mesh and drop all keys, False if the keys are not relative."""
+    co = geometry.shape_key_mix(obj)
+    if co is None:
+        return False
+    obj.shape_key_clear()
+    obj.data.vertices.foreach_set("co", co.reshape(-1))
+    obj.data.update()
+    return True
+
+
 class OpApplyShapekeys(bpy.types.Operator):
     bl_idname = "object.apply_shape_keys"
     bl_label = "Apply Shape Keys"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    all_selected: bpy.props.BoolProperty(
+        name="All Selected",
+        description="Apply the shape keys of every selected mesh, not only the active one",
+        default=False
+    )
 
     def execute(self, context):
-        obj = bpy.context.active_object
-        if obj and obj.type == 'MESH' and obj.data.shape_keys:
-            shape_key_data = obj.data.shape_keys
-            key_blocks = shape_key_data.key_blocks
-            active_shape_key_index = obj.active_shape_key_index
+        if self.all_selected:
+            objects = [obj for obj in context.selected_objects if obj.type == 'MESH']
+        else:
+            obj = bpy.context.active_object
+            objects = [obj] if obj and obj.type == 'MESH' else []
+        objects = [obj for obj in objects if obj.data.shape_keys]
+        if not objects:
+            return {'FINISHED'}
 
-            bpy.ops.object.shape_key_add(from_mix=True)
-            obj.active_shape_key_index = len(key_blocks)
+        # NOTE: key data is only written back from edit mode on exit
+        in_edit_mode = context.mode == 'EDIT_MESH'
+        if in_edit_mode:
+            bpy.ops.object.mode_set(mode='OBJECT')
 
-            for i, key_block in reversed(list(enumerate(key_blocks))):
-                if i != active_shape_key_index:
-                    obj.active_shape_key_index = i
-                    bpy.ops.object.shape_key_remove(all=False)
-            for key_block in key_blocks:
-                obj.shape_key_remove(key_block)
-            self.report({'INFO'}, "Okay, you're free to use the modifier.")
+        active = context.view_layer.objects.active
+        with profiler.phase("geometry"):
+            for obj in objects:
+                if not bake_shape_keys(obj):
+                    apply_shape_keys_with_ops(obj)
+        context.view_layer.objects.active = active
+
+        if in_edit_mode:
+            bpy.ops.object.mode_set(mode='EDIT')
+        self.report({'INFO'}, "Okay, you're free to use the modifier.")
 
         return {'FINISHED'}
 
 
 def calculate_average_normal(verts):
-    normal_sum = Vector((0.0, 0.0, 0.0))
-    for i in range(len(verts) - 2):
-        for j in range(i + 1, len(verts) - 1):
-            for k in range(j + 1, len(verts)):
-                v1 = verts[i].co
-                v2 = verts[j].co
-                v3 = verts[k].co
-                normal = (v2 - v1).cross(v3 - v1)
-                normal_sum += normal.normalized()
-    return normal_sum.normalized()
+    # Best fit plane of the vertices in any order, facing along their normals
+    co = np.array([v.co for v in verts], dtype=np.float64)
+    normals = np.array([v.normal for v in verts], dtype=np.float64)
+    return Vector(geometry.plane_normal(co, normals.sum(axis=0)))
 
 
 def get_selected_face_center_and_normal():
+    # Area weighted frame of every selected face, in world space
     obj = bpy.context.edit_object
-    me = obj.data
-    bm = bmesh.from_edit_mesh(me)
-    selected_faces = [f for f in bm.faces if f.select]
-    if selected_faces:
-        face = selected_faces[0]
-        face_normal = face.normal
-        face_center = face.calc_center_median()
-        world_center = obj.matrix_world @ face_center
-        world_normal = obj.matrix_world.to_3x3() @ face_normal.normalized()
-        return world_center, world_normal
-    else:
+    obj.update_from_editmode()
+    frame = geometry.selected_faces_frame(obj.data)
+    if frame is None:
         return None, None
+    return order_labels.frame_to_world(obj.matrix_world, *frame)
 
 
-class OpGenLogoAndMoveToSelectedVerteces(bpy.types.Operator):
+class OpGenLogoAndMoveToSelectedVerteces(AssetGenMixin, bpy.types.Operator):
     bl_idname = "object.gen_kigland_logo_and_move_to_selected_vertex"
     bl_label = "Gen Logo"
 
-    def execute(self, context):
-        loaded_objects = download_file_and_load(
-            f"{S3_BUCKET}/logo.blend",
-            bpy.app.tempdir,
-            "logo.blend"
-        )
+    asset_filename = "logo.blend"
 
-        world_center, world_normal = get_selected_face_center_and_normal()
+    def prepare(self, context):
+        self._world_center = self._world_normal = None
+        if context.edit_object is not None:
+            self._world_center, self._world_normal = get_selected_face_center_and_normal()
 
-        bpy.ops.object.mode_set(mode='OBJECT')
+    def place(self, context, loaded_objects):
+        world_center, world_normal = self._world_center, self._world_normal
+        if world_center is None:
+            self.report({'WARNING'}, "No face selected, logo left at its origin")
+            return
+
+        in_edit_mode = context.mode == 'EDIT_MESH'
+        if in_edit_mode:
+            bpy.ops.object.mode_set(mode='OBJECT')
         for loaded_obj in loaded_objects:
             loaded_obj.location = world_center
             align_quat = Vector((0, 0, 1)).rotation_difference(world_normal)
             loaded_obj.rotation_euler = align_quat.to_euler()
-        bpy.ops.object.mode_set(mode='EDIT')
-
-        return {'FINISHED'}
+        if in_edit_mode:
+            bpy.ops.object.mode_set(mode='EDIT')
 
 
 class OpGenOrderIdLabel(bpy.types.Operator):
@@ -450,80 +1358,72 @@ class OpGenOrderIdLabel(bpy.types.Operator):
         scene = context.scene
         text_tool = scene.text_tool
 
-        # Create a new text object
-        font_curve = bpy.data.curves.new(type='FONT', name='Font Curve')
-        text_obj = bpy.data.objects.new(
-            "label.order", font_curve)
-        context.collection.objects.link(text_obj)
-
-        if text_tool.gen_full_order_id_label:
-            text_obj.data.body = f'KIG.LAND\nKIGURUMI\n{text_tool.user_input_order_id}'
-        else:
-            text_obj.data.body = f'{text_tool.user_input_order_id}'
-
-        # Update the scene to calculate dimensions
-        bpy.context.view_layer.update()
-
-        # Resize the text object to have a width of 1.5
-        text_height = text_obj.dimensions.y
-        target_height = 0
-
-        if text_tool.gen_full_order_id_label:
-            target_height = 10
+        world_center = world_normal = None
+        if context.edit_object is not None:
+            world_center, world_normal = get_selected_face_center_and_normal()
         else:
-            target_height = 3
+            self.report(
+                {'INFO'}, "If your need move it, plz use it in editor mode")
 
-        scale_factor = target_height / text_height
-        text_obj.scale = (scale_factor, scale_factor, scale_factor)
+        glyphs = get_glyph_cache()
+        try:
+            with profiler.phase("geometry"):
+                order_labels.generate_order_label(
+                    context.collection,
+                    text_tool.user_input_order_id,
+                    text_tool.gen_full_order_id_label,
+                    world_center,
+                    world_normal,
+                    glyphs
+                )
+        except ValueError as e:
+            self.report({'ERROR'}, str(e))
+            return {'CANCELLED'}
+        finally:
+            glyphs.save()
 
-        world_center = world_normal = None
+        return {'FINISHED'}
 
-        try:
-            (world_center, world_normal) = get_selected_face_center_and_normal()
-            bpy.ops.object.mode_set(mode='OBJECT')
-            pass
-        except:  # noqa: E722
-            self.report(
-                {'INFO'}, "If your need move it, plz use it in editor mode")
 
-        # Clean active object
-        for obj in bpy.context.view_layer.objects:
-            obj.select_set(False)
+class OpGenOrderIdLabelsFromManifest(bpy.types.Operator):
+    bl_idname = "text.gen_order_id_labels_from_manifest"
+    bl_label = "Gen Labels From Manifest"
+    bl_description = "Generate a label for every order in a CSV or JSON manifest"
 
-        text_obj.select_set(True)
-        context.view_layer.objects.active = text_obj
-        bpy.ops.object.convert(target='MESH')
-        bpy.ops.object.origin_set(type='ORIGIN_GEOMETRY', center='BOUNDS')
+    filepath: bpy.props.StringProperty(subtype='FILE_PATH')
+    filter_glob: bpy.props.StringProperty(default="*.csv;*.json", options={'HIDDEN'})
 
-        bpy.ops.object.mode_set(mode='EDIT')
-        bpy.ops.mesh.select_all(action='SELECT')
-        bpy.ops.mesh.extrude_region_move(  # extrude_amount
-            TRANSFORM_OT_translate={"value": (0, 0, 2)})
-        bpy.ops.object.mode_set(mode='OBJECT')
+    def invoke(self, context, event):
+        context.window_manager.fileselect_add(self)
+        return {'RUNNING_MODAL'}
 
-        bpy.ops.object.transform_apply(
-            location=False, rotation=False, scale=True)
+    def execute(self, context):
+        text_tool = context.scene.text_tool
 
-        if world_center is None:
-            return {'FINISHED'}
-        else:
-            text_obj.location = world_center
-            align_quat = Vector((0, 0, 1)).rotation_difference(world_normal)
-            text_obj.rotation_euler = align_quat.to_euler()
-            return {'FINISHED'}
+        try:
+            entries = order_labels.read_manifest(bpy.path.abspath(self.filepath))
+        except (OSError, ValueError, KeyError) as e:
+            self.report({'ERROR'}, f"Can not read manifest: {e}")
+            return {'CANCELLED'}
+
+        glyphs = get_glyph_cache()
+        with profiler.phase("geometry"):
+            results = order_labels.generate_labels_from_manifest(
+                context.collection, entries, text_tool.gen_full_order_id_label, glyphs=glyphs)
+        glyphs.save()
+
+        failed = [(entry, result) for entry, result in results if isinstance(result, Exception)]
+        for entry, error in failed:
+            self.report({'WARNING'}, f"{entry['order_id']}: {error}")
+        self.report({'INFO'}, f"{len(results) - len(failed)} label(s) generated, {len(failed)} failed")
+        return {'FINISHED'}
 
 
-class OpGenLockComponents(bpy.types.Operator):
+class OpGenLockComponents(AssetGenMixin, bpy.types.Operator):
     bl_idname = "object.gen_lock_components"
     bl_label = "Gen NRH Lock "
 
-    def execute(self, context):
-        download_file_and_load(
-            f"{S3_BUCKET}/lock_nrh.blend",
-            bpy.app.tempdir,
-            "lock_nrh.blend"
-        )
-        return {'FINISHED'}
+    asset_filename = "lock_nrh.blend"
 
 
 # OpApplyShapekeys
@@ -539,6 +1439,48 @@ def row_prop(self, context, id):
     self.layout.row().prop(context, id)
 
 
+class SelectionBoundsCache:
+    # Total dimensions of the selected objects for UIBodyData, kept until a
+    # transform or geometry update or a different selection
+
+    def __init__(self):
+        self._key = None
+        self._dimensions = None
+
+    def invalidate(self):
+        self._key = None
+
+    def dimensions(self, context, objects, exact=False):
+        key = (exact, tuple(obj.as_pointer() for obj in objects))
+        if key != self._key:
+            if exact:
+                low, high = geometry.objects_exact_bounds(objects, context.view_layer.depsgraph)
+            else:
+                low, high = geometry.objects_bounds(objects)
+            self._dimensions = tuple(float(v) for v in high - low)
+            self._key = key
+        return self._dimensions
+
+
+selection_bounds = SelectionBoundsCache()
+
+
+@bpy.app.handlers.persistent
+def selection_bounds_depsgraph_update(scene, depsgraph):
+    for update in depsgraph.updates:
+        if isinstance(update.id, bpy.types.Object) and \
+                (update.is_updated_transform or update.is_updated_geometry):
+            selection_bounds.invalidate()
+            return
+
+
+@bpy.app.handlers.persistent
+def selection_load_post(*args):
+    # Both caches are keyed by pointers, which a newly loaded file may reuse
+    selection_bounds.invalidate()
+    selection_state.reset()
+
+
 class UIEnv(bpy.types.Panel):
     bl_label = "KigLand - Env Unit"
     bl_idname = "OBJECT_PT_kigland_toolbox_env"
@@ -563,28 +1505,22 @@ class UIInfoState(bpy.types.Panel):
     def draw(self, context):
         if bpy.context.mode == 'EDIT_MESH':
 
-            obj = bpy.context.edit_object
-            me = obj.data
-            bm = bmesh.from_edit_mesh(me)
+            state = selection_state.get(context)
+            if state is None:
+                return
 
-            selected_faces = [f for f in bm.faces if f.select]
-            selected_verts = [v for v in bm.verts if v.select]
-
-            if len(selected_verts) > 1:
+            if state.vert_count > 1:
                 row_label(self, "Vertex info", "PIVOT_CURSOR")
 
-                if (loc := get_average_location_of_selected_verts()):
+                if (loc := state.centroid):
                     row_label(self, f"Ave. loc: X:{loc.x:.2f}, Y:{loc.y:.2f}, Z:{loc.z:.2f}")
 
                 # row_op(self,OpShowAverageLocationOfSelectedVerts)
 
-                if len(selected_faces) > 0:
-                    pass
-
-            if len(selected_verts) == 1:
+            if state.vert_count == 1:
                 row_label(self, "Vertex info", "PIVOT_CURSOR")
-                loc = get_active_vertex_location()
-                row_label(self, f"loc: X:{loc.x:.2f}, Y:{loc.y:.2f}, Z:{loc.z:.2f}")
+                if (loc := state.active_co or state.centroid):
+                    row_label(self, f"loc: X:{loc.x:.2f}, Y:{loc.y:.2f}, Z:{loc.z:.2f}")
 
 
 class UIToolBox(bpy.types.Panel):
@@ -602,6 +1538,19 @@ class UIToolBox(bpy.types.Panel):
         row_op(self, OpGenEars)
         row_op(self, OpGenLockComponents)
 
+        row_op(self, OpMakeComponentSingleUser)
+
+        if is_prefetching():
+            row_label(self, "Warming cache...", "URL")
+        else:
+            row_op(self, OpWarmAssetCache)
+
+        if asset_fetch_jobs:
+            box = layout.box()
+            for job in asset_fetch_jobs:
+                box.label(text=f"{job.name}: {job.fraction * 100:.0f}%", icon='URL')
+            box.operator(OpCancelAssetFetches.bl_idname, icon='CANCEL')
+
         layout.separator()
         layout.separator()
 
@@ -610,27 +1559,20 @@ class UIToolBox(bpy.types.Panel):
         row_prop(self, context.scene.text_tool, "user_input_order_id")
         row_prop(self, context.scene.text_tool, "gen_full_order_id_label")
         row_op(self, OpGenOrderIdLabel)
+        row_op(self, OpGenOrderIdLabelsFromManifest)
 
         # if in edit mode, show the active vertex location
         if bpy.context.mode == 'EDIT_MESH':
 
-            obj = bpy.context.edit_object
-            me = obj.data
-            bm = bmesh.from_edit_mesh(me)
+            state = selection_state.get(context)
 
-            selected_faces = [f for f in bm.faces if f.select]
-            selected_verts = [v for v in bm.verts if v.select]
-
-            if len(selected_verts) > 1:
+            if state is not None and state.vert_count > 1:
                 #
-                if len(selected_faces) > 0:
+                if state.face_count > 0:
                     row_label(self, "On Selected Face", "FACE_MAPS")
                     row_op(self, OpGenLogoAndMoveToSelectedVerteces)
                     row_op(self, OpGenOrderIdLabel)
 
-            if len(selected_verts) == 1:
-                pass
-
 
 class UIBodyData(bpy.types.Panel):
     bl_label = "KigLand - Body & Head"
@@ -672,9 +1614,10 @@ class UIBodyData(bpy.types.Panel):
         """
         # GB/T HEAD GENERATOR
         row_label(self, "Head (mm)", "COMMUNITY")
+        row_op(self, OpMeasureHead)
         row_prop(self, head_data, "head_height")
         row_prop(self, head_data, "head_width")
-        #row_prop(self, head_data, "head_circumference")
+        row_prop(self, head_data, "head_circumference")
 
         if (head_data.head_width < head_data.head_height < head_data.head_circumference) and\
                 head_data.head_width >= 120 and \
@@ -686,8 +1629,11 @@ class UIBodyData(bpy.types.Panel):
             row_label(self, "WARNING DATA MAYBE INCORRECT",
                       "SEQUENCE_COLOR_01")
 
-        row_prop(self, head_data, "head_gen_scale_by")
-        # row_prop(self,head_data, "head_type")
+        row_prop(self, head_data, "head_gen_mode")
+        if head_data.head_gen_mode == 'SCALE':
+            row_prop(self, head_data, "head_gen_scale_by")
+        elif head_data.head_gen_mode == 'SIZE':
+            row_prop(self, head_data, "head_type")
 
         row_op(self, OpGenGBTHead)
         
@@ -739,24 +1685,11 @@ class UIBodyData(bpy.types.Panel):
             layout.label(text="No objects selected.")
             return
 
+        row_prop(self, head_data, "measure_exact")
+
         # Calculate the total bounding box
-        min_x, min_y, min_z = [float('inf')] * 3
-        max_x, max_y, max_z = [float('-inf')] * 3
-
-        for obj in selected_objects:
-            # We need to calculate the global position of the bounding box corners
-            for corner in obj.bound_box:
-                global_corner = obj.matrix_world @ Vector(corner)
-                min_x = min(min_x, global_corner.x)
-                min_y = min(min_y, global_corner.y)
-                min_z = min(min_z, global_corner.z)
-                max_x = max(max_x, global_corner.x)
-                max_y = max(max_y, global_corner.y)
-                max_z = max(max_z, global_corner.z)
-
-        total_width = max_x - min_x
-        total_depth = max_y - min_y
-        total_height = max_z - min_z
+        total_width, total_depth, total_height = selection_bounds.dimensions(
+            context, selected_objects, head_data.measure_exact)
 
         # Display the total bounding box dimensions
         box = layout.box()
@@ -798,46 +1731,208 @@ class UIDangerOp(bpy.types.Panel):
         row_op(self, OpRemoveObjectAllVertexGroups)
         row_op(self, OpRemoveObjectAllShapeKeys)
         row_op(self, OpApplyShapekeys)
+        layout.row().operator(OpApplyShapekeys.bl_idname, text="Apply Shape Keys (All Selected)").all_selected = True
 
-def bmesh_copy_from_object(obj, transform=True, triangulate=True, apply_modifiers=False):
-    """Returns a transformed, triangulated copy of the mesh"""
+def process_rss():
+    # Resident set size in bytes, 0 where it can not be read
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+
+def process_peak_rss():
+    # High-water mark of the resident set in bytes, 0 where it can not be read
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    try:
+        import psutil
+        # NOTE: peak_wset only exists on Windows
+        return psutil.Process().memory_info().peak_wset
+    except (ImportError, AttributeError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    except (ImportError, OSError):
+        return 0
+
+
+def reset_peak_rss():
+    # Linux only: restart the high-water mark from the current resident set
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def bmesh_copy_from_object(obj, transform=True, triangulate=True, apply_modifiers=False,
+                           lean=False, normal_update=True, stats=None):
+    """Returns a transformed, triangulated copy of the mesh
+
+    ``lean`` copies positions and faces only, no UVs, vertex groups, colors
+    or other layers. ``normal_update=False`` skips recalculating normals
+    after the transform. If given, ``stats`` receives the element counts and
+    the growth of the process memory high-water mark in bytes. ``peak_exact``
+    is False where the mark could not be reset and the call stayed below an
+    earlier peak, then ``peak_bytes`` is the growth of the final RSS.
+    """
 
     assert obj.type == 'MESH'
 
-    if apply_modifiers and obj.modifiers:
-        import bpy
+    if stats is not None:
+        rss_before = process_rss()
+        peak_reset = reset_peak_rss()
+        peak_before = process_peak_rss()
+
+    if lean:
+        # Geometry only temporary mesh, transformed while still in arrays
         depsgraph = bpy.context.evaluated_depsgraph_get()
-        obj_eval = obj.evaluated_get(depsgraph)
-        me = obj_eval.to_mesh()
+        with geometry.evaluated_mesh(obj, depsgraph, apply_modifiers) as me:
+            arrays = mesh_arrays.mesh_to_arrays(me)
+        co = arrays["co"]
+        if transform:
+            co = geometry.transform_points(co.astype(np.float64), obj.matrix_world)
+        lean_me = mesh_arrays.mesh_from_arrays(
+            "bmesh_copy_lean", co, arrays["vertex_index"], arrays["loop_start"])
+        del arrays, co
+
         bm = bmesh.new()
-        bm.from_mesh(me)
-        obj_eval.to_mesh_clear()
+        bm.from_mesh(lean_me)
+        bpy.data.meshes.remove(lean_me)
     else:
-        me = obj.data
-        if obj.mode == 'EDIT':
-            bm_orig = bmesh.from_edit_mesh(me)
-            bm = bm_orig.copy()
-        else:
+        if apply_modifiers and obj.modifiers:
+            depsgraph = bpy.context.evaluated_depsgraph_get()
+            obj_eval = obj.evaluated_get(depsgraph)
+            me = obj_eval.to_mesh()
             bm = bmesh.new()
             bm.from_mesh(me)
+            obj_eval.to_mesh_clear()
+        else:
+            me = obj.data
+            if obj.mode == 'EDIT':
+                bm_orig = bmesh.from_edit_mesh(me)
+                bm = bm_orig.copy()
+            else:
+                bm = bmesh.new()
+                bm.from_mesh(me)
 
-    # TODO. remove all customdata layers.
-    # would save ram
-
-    if transform:
-        matrix = obj.matrix_world.copy()
-        if not matrix.is_identity:
-            bm.transform(matrix)
-            # Update normals if the matrix has no rotation.
-            matrix.translation.zero()
+        if transform:
+            matrix = obj.matrix_world.copy()
             if not matrix.is_identity:
-                bm.normal_update()
+                bm.transform(matrix)
+                # Update normals if the matrix has no rotation.
+                matrix.translation.zero()
+                if normal_update and not matrix.is_identity:
+                    bm.normal_update()
 
     if triangulate:
         bmesh.ops.triangulate(bm, faces=bm.faces)
 
+    if stats is not None:
+        peak_after = process_peak_rss()
+        stats["peak_exact"] = peak_reset or peak_after > peak_before
+        peak = peak_after if stats["peak_exact"] else process_rss()
+        stats["verts"] = len(bm.verts)
+        stats["faces"] = len(bm.faces)
+        stats["peak_bytes"] = max(peak - rss_before, 0)
+
     return bm
 
+def calc_costs(scene, cost_monitor, volume):
+    # Returns volume, weight (g) and cost (CNY) as formatted strings,
+    # weight and cost are None without a unit system
+    unit = scene.unit_settings
+    if unit.system == 'NONE':
+        return clean_float(volume, 8), None, None
+
+    scale = unit.scale_length
+    length, symbol = get_unit(unit.system, unit.length_unit)
+    volume_unit = volume * (scale ** 3.0) / (length ** 3.0)
+
+    volume_str = clean_float(volume_unit, 4)
+    volume_fmt = f"{volume_str} {symbol}³"
+
+    volume_cm3 = volume * (scale ** 3.0) / (0.01 ** 3.0)
+    weight = volume_cm3 * cost_monitor.density
+    weight_fmt = clean_float(weight,2)
+    weight_str = f"{weight_fmt} g"
+    cost = volume_cm3 * cost_monitor.density * cost_monitor.material_cost
+    cost_fmt = clean_float(cost, 2)
+    cost_str = f"{cost_fmt} CNY"
+
+    return volume_fmt, weight_str, cost_str
+
+
+SUPPORT_BUILD_DIRECTIONS = {
+    'POS_Z': (0.0, 0.0, 1.0),
+    'NEG_Z': (0.0, 0.0, -1.0),
+    'POS_Y': (0.0, 1.0, 0.0),
+    'NEG_Y': (0.0, -1.0, 0.0),
+    'POS_X': (1.0, 0.0, 0.0),
+    'NEG_X': (-1.0, 0.0, 0.0),
+}
+
+# object name -> (mesh fingerprint, world matrix, build direction, overhang angle), support column volume,
+# most recently used last
+_support_volumes = {}
+SUPPORT_CACHE_SIZE = 16
+
+
+def object_support_volume(obj, depsgraph, cost_monitor):
+    # World space volume under the overhangs of obj, before the support infill
+    with geometry.evaluated_mesh(obj, depsgraph) as me:
+        key = (geometry.mesh_fingerprint(me), tuple(v for row in obj.matrix_world for v in row),
+               cost_monitor.support_build_direction, cost_monitor.support_overhang_angle)
+        cached = _support_volumes.pop(obj.name, None)
+        if cached is None or cached[0] != key:
+            co = geometry.transform_points(geometry.mesh_vertex_coords(me), obj.matrix_world)
+            cached = (key, geometry.support_volume(
+                co, geometry.mesh_loop_triangles(me),
+                SUPPORT_BUILD_DIRECTIONS[cost_monitor.support_build_direction],
+                cost_monitor.support_overhang_angle))
+    _support_volumes[obj.name] = cached
+    while len(_support_volumes) > SUPPORT_CACHE_SIZE:
+        del _support_volumes[next(iter(_support_volumes))]
+    return cached[1]
+
+
+def update_support_costs(scene, cost_monitor, obj, depsgraph, volume):
+    # Support and total fields of the cost monitor for obj with the given part volume,
+    # cleared while the estimate is off so they never show a stale object
+    if not cost_monitor.support_enabled:
+        cost_monitor.support_volume = cost_monitor.support_weight = ""
+        cost_monitor.support_cost = cost_monitor.total_cost = ""
+        return
+
+    with profiler.phase("geometry"):
+        support = object_support_volume(obj, depsgraph, cost_monitor) * cost_monitor.support_infill
+    cost_monitor.support_volume, support_weight, support_cost = calc_costs(scene, cost_monitor, support)
+    cost_monitor.support_weight = support_weight or ""
+    cost_monitor.support_cost = support_cost or ""
+    _, _, total_cost = calc_costs(scene, cost_monitor, volume + support)
+    cost_monitor.total_cost = total_cost or ""
+
+
+@bpy.app.handlers.persistent
+def support_load_post(*args):
+    _support_volumes.clear()
+
+
 class OpGenCost(bpy.types.Operator):
     bl_idname = "object.gen_cost"
     bl_label = "Gen Cost"
@@ -847,38 +1942,285 @@ class OpGenCost(bpy.types.Operator):
         cost_monitor = context.scene.cost_monitor
         
         scene = context.scene
-        unit = scene.unit_settings
-        scale = 1.0 if unit.system == 'NONE' else unit.scale_length
         obj = context.active_object
+        if obj is None:
+            self.report({'ERROR'}, "No active object")
+            return {'CANCELLED'}
 
-        bm = bmesh_copy_from_object(obj, apply_modifiers=True)
-        volume = bm.calc_volume()
-        bm.free()
-        volume_fmt = ""
-        if unit.system == 'NONE':
-            volume_fmt = clean_float(volume, 8)
-        else:
-            length, symbol = get_unit(unit.system, unit.length_unit)
-            volume_unit = volume * (scale ** 3.0) / (length ** 3.0)
-            
-
-            volume_str = clean_float(volume_unit, 4)
-            volume_fmt = f"{volume_str} {symbol}³"
-
-            volume_cm3 = volume * (scale ** 3.0) / (0.01 ** 3.0)
-            weight = volume_cm3 * cost_monitor.density
-            weight_fmt = clean_float(weight,2)
-            weight_str = f"{weight_fmt} g"
-            cost = volume_cm3 * cost_monitor.density * cost_monitor.material_cost
-            cost_fmt = clean_float(cost, 2)
-            cost_str = f"{cost_fmt} CNY"
-            
+        with profiler.phase("geometry"):
+            if cost_monitor.volume_engine == 'NUMPY':
+                volume = geometry.object_volume(obj, context.evaluated_depsgraph_get())
+            else:
+                stats = {}
+                bm = bmesh_copy_from_object(obj, apply_modifiers=True, lean=True, normal_update=False, stats=stats)
+                volume = bm.calc_volume()
+                bm.free()
+        if cost_monitor.volume_engine == 'BMESH':
+            memory = "peak memory" if stats["peak_exact"] else "memory"
+            self.report({'INFO'}, f"{stats['verts']} verts, {memory} +{stats['peak_bytes'] / (1024 * 1024):.1f} MB")
+
+        volume_fmt, weight_str, cost_str = calc_costs(scene, cost_monitor, volume)
+        if weight_str is not None:
             cost_monitor.selected_object_info = f"{volume_fmt} -> {cost_str}"
             cost_monitor.volume = volume_fmt
             cost_monitor.cost = cost_str
             cost_monitor.weight = weight_str
+
+        update_support_costs(scene, cost_monitor, obj, context.evaluated_depsgraph_get(), volume)
+        return {'FINISHED'}
+
+
+# Live cost: depsgraph updates mark the active object dirty, a debounced
+# timer recomputes it on the main thread once the edits settle down
+LIVE_COST_DEBOUNCE = 0.3
+
+_live_cost = {
+    "object": None,
+    "deadline": 0.0,
+    "timer": False,
+    "geometry_dirty": True,
+}
+# object name -> (mesh fingerprint, local signed volume), most recently used last
+_live_cost_volumes = {}
+LIVE_COST_CACHE_SIZE = 16
+
+
+def schedule_live_cost(geometry_dirty):
+    _live_cost["geometry_dirty"] |= geometry_dirty
+    _live_cost["deadline"] = time.monotonic() + LIVE_COST_DEBOUNCE
+    if not _live_cost["timer"]:
+        _live_cost["timer"] = True
+        # NOTE: persistent, a file loaded during the debounce must not drop the timer
+        bpy.app.timers.register(refresh_live_cost, first_interval=LIVE_COST_DEBOUNCE, persistent=True)
+
+
+def refresh_live_cost():
+    remaining = _live_cost["deadline"] - time.monotonic()
+    if remaining > 0.0:
+        return remaining
+    _live_cost["timer"] = False
+
+    context = bpy.context
+    scene = context.scene
+    obj = context.view_layer.objects.active if context.view_layer else None
+    if scene is None or not scene.cost_monitor.live_update or obj is None or obj.type != 'MESH':
+        return None
+
+    cached = _live_cost_volumes.get(obj.name)
+    if _live_cost["geometry_dirty"] or cached is None:
+        with geometry.evaluated_mesh(obj, context.evaluated_depsgraph_get()) as me:
+            fingerprint = geometry.mesh_fingerprint(me)
+            if cached is None or cached[0] != fingerprint:
+                cached = (fingerprint, geometry.mesh_signed_volume(me))
+    _live_cost_volumes.pop(obj.name, None)
+    _live_cost_volumes[obj.name] = cached
+    while len(_live_cost_volumes) > LIVE_COST_CACHE_SIZE:
+        del _live_cost_volumes[next(iter(_live_cost_volumes))]
+    _live_cost["geometry_dirty"] = False
+    _live_cost["object"] = obj.name
+
+    det = np.linalg.det(geometry.matrix_to_array(obj.matrix_world)[:3, :3])
+    volume = abs(cached[1] * det)
+
+    cost_monitor = scene.cost_monitor
+    volume_fmt, weight_str, cost_str = calc_costs(scene, cost_monitor, volume)
+    if weight_str is not None:
+        cost_monitor.selected_object_info = f"{volume_fmt} -> {cost_str}"
+        cost_monitor.volume = volume_fmt
+        cost_monitor.cost = cost_str
+        cost_monitor.weight = weight_str
+    update_support_costs(scene, cost_monitor, obj, context.evaluated_depsgraph_get(), volume)
+    return None
+
+
+@bpy.app.handlers.persistent
+def live_cost_depsgraph_update(scene, depsgraph):
+    if not scene.cost_monitor.live_update:
+        return
+
+    obj = bpy.context.view_layer.objects.active if bpy.context.view_layer else None
+    if obj is None:
+        return
+    if obj.name != _live_cost["object"]:
+        schedule_live_cost(geometry_dirty=False)
+        return
+
+    for update in depsgraph.updates:
+        if isinstance(update.id, bpy.types.Object) and update.id.original == obj:
+            if update.is_updated_geometry:
+                schedule_live_cost(geometry_dirty=True)
+            elif update.is_updated_transform:
+                schedule_live_cost(geometry_dirty=False)
+            return
+
+
+@bpy.app.handlers.persistent
+def live_cost_load_post(*args):
+    # Object names in the cache belong to the previous file
+    _live_cost_volumes.clear()
+    _live_cost["object"] = None
+    _live_cost["geometry_dirty"] = True
+
+
+def cost_batch_objects(context, cost_monitor):
+    if cost_monitor.batch_scope == 'SELECTED':
+        objects = context.selected_objects
+    elif cost_monitor.batch_scope == 'COLLECTION':
+        collection = cost_monitor.batch_collection
+        objects = collection.all_objects if collection else []
+    else:
+        objects = context.scene.objects
+    return [obj for obj in objects if obj.type == 'MESH']
+
+
+class OpGenCostBatch(bpy.types.Operator):
+    bl_idname = "object.gen_cost_batch"
+    bl_label = "Gen Cost (Batch)"
+    bl_description = "Volume, weight and cost of every mesh in the batch scope and their total"
+
+    def execute(self, context):
+        scene = context.scene
+        cost_monitor = scene.cost_monitor
+
+        objects = cost_batch_objects(context, cost_monitor)
+        if not objects:
+            self.report({'ERROR'}, "No mesh in batch")
+            return {'CANCELLED'}
+
+        with profiler.phase("geometry"):
+            volumes = geometry.batch_volumes(objects, context.evaluated_depsgraph_get())
+
+        supports = [0.0] * len(volumes)
+        if cost_monitor.support_enabled:
+            depsgraph = context.evaluated_depsgraph_get()
+            with profiler.phase("geometry"):
+                supports = [object_support_volume(obj, depsgraph, cost_monitor) * cost_monitor.support_infill
+                            for obj, _ in volumes]
+
+        cost_monitor.batch_results.clear()
+        for (obj, volume), support in zip(volumes, supports):
+            entry = cost_monitor.batch_results.add()
+            entry.name = obj.name
+            entry.volume, weight_str, cost_str = calc_costs(scene, cost_monitor, volume)
+            entry.weight = weight_str or ""
+            entry.cost = cost_str or ""
+            entry.support_cost = ""
+            if cost_monitor.support_enabled:
+                _, _, support_cost = calc_costs(scene, cost_monitor, support)
+                entry.support_cost = support_cost or ""
+
+        # Supports are material too, the batch total includes them
+        total_volume = sum(volume for _, volume in volumes) + sum(supports)
+        volume_fmt, weight_str, cost_str = calc_costs(scene, cost_monitor, total_volume)
+        cost_monitor.batch_total = " | ".join(v for v in (volume_fmt, weight_str, cost_str) if v)
+        self.report({'INFO'}, f"{len(volumes)} part(s): {cost_monitor.batch_total}")
+        return {'FINISHED'}
+
+# Wall thickness: one BVH tree per object, rebuilt when its mesh or transform changes
+thickness_shells = thickness.ShellCache()
+# Ray casting time per modal step, keeps the viewport responsive
+THICKNESS_STEP_BUDGET = 0.05
+
+
+@bpy.app.handlers.persistent
+def thickness_load_post(*args):
+    thickness_shells.clear()
+
+
+def thickness_bmesh(obj):
+    return bmesh_copy_from_object(obj, triangulate=False, apply_modifiers=True, lean=True, normal_update=False)
+
+
+class OpAnalyzeThickness(bpy.types.Operator):
+    bl_idname = "object.analyze_thickness"
+    bl_label = "Analyze Wall Thickness"
+    bl_description = ("Cast a ray inward from each sampled face and mark the faces whose wall is "
+                      "thinner than the minimum in the thickness color attribute")
+
+    @classmethod
+    def poll(cls, context):
+        obj = context.active_object
+        return obj is not None and obj.type == 'MESH' and obj.mode == 'OBJECT'
+
+    def start(self, context):
+        cost_monitor = context.scene.cost_monitor
+        self._obj = context.active_object
+        self._to_mm = scene_to_mm(context.scene)
+
+        with profiler.phase("geometry"):
+            shell = thickness_shells.get(self._obj, context.evaluated_depsgraph_get(), thickness_bmesh)
+        self._job = thickness.ThicknessJob(
+            shell, cost_monitor.thickness_max_distance / self._to_mm, cost_monitor.thickness_max_samples)
+        self._started = time.perf_counter()
+
+    def finish(self, context):
+        cost_monitor = context.scene.cost_monitor
+        job = self._job
+        min_thickness = cost_monitor.thickness_min / self._to_mm
+        summary = job.summary(min_thickness)
+        if summary["samples"] == 0:
+            self.report({'ERROR'}, "Mesh has no faces")
+            return {'CANCELLED'}
+
+        me = self._obj.data
+        if len(me.polygons) == summary["faces"]:
+            thickness.write_attributes(me, job.face_values(), min_thickness)
+        else:
+            self.report({'WARNING'}, "Modifiers change the face count, only the summary is kept")
+
+        cost_monitor.thickness_summary = (
+            f"min {summary['min'] * self._to_mm:.2f} mm, median {summary['median'] * self._to_mm:.2f} mm, "
+            f"{summary['thin']} thin of {summary['samples']} ({summary['thin_area_fraction'] * 100:.1f}% area)")
+        self.report({'INFO'}, f"{cost_monitor.thickness_summary} in {time.perf_counter() - self._started:.2f} s")
         return {'FINISHED'}
 
+    def execute(self, context):
+        self.start(context)
+        with profiler.phase("geometry"):
+            while not self._job.step():
+                pass
+        return self.finish(context)
+
+    def invoke(self, context, event):
+        self.start(context)
+        wm = context.window_manager
+        wm.progress_begin(0, 100)
+        self._timer = wm.event_timer_add(0.01, window=context.window)
+        wm.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        if event.type == 'ESC' and event.value == 'PRESS':
+            self.cleanup(context)
+            self.report({'WARNING'}, f"Thickness analysis cancelled at {self._job.fraction * 100:.0f}%")
+            return {'CANCELLED'}
+
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+
+        job = self._job
+        deadline = time.perf_counter() + THICKNESS_STEP_BUDGET
+        with profiler.phase("geometry"):
+            while not job.finished and time.perf_counter() < deadline:
+                job.step()
+
+        if not job.finished:
+            context.window_manager.progress_update(job.fraction * 100)
+            context.workspace.status_text_set(
+                f"Wall thickness: {job.done}/{len(job.faces)} rays (Esc to cancel)")
+            return {'RUNNING_MODAL'}
+
+        self.cleanup(context)
+        return self.finish(context)
+
+    def cleanup(self, context):
+        wm = context.window_manager
+        wm.event_timer_remove(self._timer)
+        wm.progress_end()
+        context.workspace.status_text_set(None)
+        tag_redraw_view3d(context)
+
+
 class UICosts(bpy.types.Panel):
     bl_label = "KigLand - Costs Monitor"
     bl_idname = "OBJECT_PT_kigland_costs_op"
@@ -900,25 +2242,180 @@ class UICosts(bpy.types.Panel):
         row_prop(self, cost_monitor, "volume")
         row_prop(self, cost_monitor, "cost")
         row_prop(self, cost_monitor, "weight")
+        row_prop(self, cost_monitor, "volume_engine")
+        row_prop(self, cost_monitor, "live_update")
         row_op(self, OpGenCost)
-        row_label(self, "Base Price (Supports Excluded)")
+
+        row_label(self, "Supports", "MOD_LATTICE")
+        row_prop(self, cost_monitor, "support_enabled")
+        if cost_monitor.support_enabled:
+            row_prop(self, cost_monitor, "support_overhang_angle")
+            row_prop(self, cost_monitor, "support_build_direction")
+            row_prop(self, cost_monitor, "support_infill")
+            if cost_monitor.support_cost:
+                row_label(self, f"Supports: {cost_monitor.support_volume} {cost_monitor.support_weight} "
+                                f"{cost_monitor.support_cost}")
+                row_label(self, f"Total: {cost_monitor.total_cost}", "RNA")
+        else:
+            row_label(self, "Base Price (Supports Excluded)")
+
+        row_label(self, "Batch Costs", "OUTLINER_OB_GROUP_INSTANCE")
+        row_prop(self, cost_monitor, "batch_scope")
+        if cost_monitor.batch_scope == 'COLLECTION':
+            row_prop(self, cost_monitor, "batch_collection")
+        row_op(self, OpGenCostBatch)
+
+        if cost_monitor.batch_results:
+            box = layout.box()
+            col = box.column()
+            for entry in cost_monitor.batch_results:
+                supports = f" + {entry.support_cost} supports" if entry.support_cost else ""
+                col.label(text=f"{entry.name}: {entry.volume} {entry.weight} {entry.cost}{supports}")
+            col.separator()
+            col.label(text=f"Total: {cost_monitor.batch_total}", icon='RNA')
+
+        row_label(self, "Wall Thickness", "MOD_SOLIDIFY")
+        row_prop(self, cost_monitor, "thickness_min")
+        row_prop(self, cost_monitor, "thickness_max_distance")
+        row_prop(self, cost_monitor, "thickness_max_samples")
+        row_op(self, OpAnalyzeThickness)
+        if cost_monitor.thickness_summary:
+            row_label(self, cost_monitor.thickness_summary)
 
             
+class OpCaptureProfile(bpy.types.Operator):
+    bl_idname = "object.capture_toolbox_profile"
+    bl_label = "Profile Next Call"
+    bl_description = "Run the next toolbox operator under cProfile, the result goes into the timings export"
+
+    target: bpy.props.StringProperty(
+        name="Operator",
+        description="Class name like OpGenCost, empty for whatever runs next",
+        default=""
+    )
+
+    def execute(self, context):
+        profiler.capture_next(self.target)
+        return {'FINISHED'}
+
+
+class OpExportTimings(bpy.types.Operator):
+    bl_idname = "object.export_toolbox_timings"
+    bl_label = "Export Timings"
+
+    filepath: bpy.props.StringProperty(subtype='FILE_PATH')
+    filter_glob: bpy.props.StringProperty(default="*.json", options={'HIDDEN'})
+
+    def invoke(self, context, event):
+        context.window_manager.fileselect_add(self)
+        return {'RUNNING_MODAL'}
+
+    def execute(self, context):
+        filepath = bpy.path.ensure_ext(self.filepath, ".json")
+        profiler.export(filepath)
+        self.report({'INFO'}, f"Saved timings to {filepath}")
+        return {'FINISHED'}
+
+
+class OpResetTimings(bpy.types.Operator):
+    bl_idname = "object.reset_toolbox_timings"
+    bl_label = "Reset Timings"
+
+    def execute(self, context):
+        profiler.reset()
+        return {'FINISHED'}
+
+
+# Slowest calls listed in the debug panel
+TIMINGS_SHOWN = 12
+
+
+class UIDebugTimings(bpy.types.Panel):
+    bl_label = "KigLand - Debug Timings"
+    bl_idname = "OBJECT_PT_kigland_debug_timings"
+    bl_space_type = 'VIEW_3D'
+    bl_region_type = 'UI'
+    bl_category = 'KigLand Toolbox'
+    bl_options = {'DEFAULT_CLOSED'}
+
+    def draw(self, context):
+        layout = self.layout
+
+        prefs = get_preferences()
+        if prefs:
+            row_prop(self, prefs, "record_timings")
+
+        report = profiler.report()
+        if report:
+            box = layout.box()
+            col = box.column()
+            for key, phases in list(report.items())[:TIMINGS_SHOWN]:
+                total = phases.get("total")
+                if total is not None:
+                    col.label(text=f"{key} x{total['count']}: p50 {format_ms(total['p50'])} "
+                                   f"p90 {format_ms(total['p90'])} max {format_ms(total['max'])} ms")
+                else:
+                    col.label(text=key)
+                for phase in ("network", "load", "geometry"):
+                    if phase in phases:
+                        col.label(text=f"    {phase}: p50 {format_ms(phases[phase]['p50'])} ms")
+        else:
+            row_label(self, "No calls recorded yet")
+
+        row_op(self, OpCaptureProfile)
+        if profiler.capture_armed:
+            row_label(self, "Waiting for the next call", "REC")
+        elif profiler.last_capture:
+            row_label(self, f"Captured {profiler.last_capture['key']}", "CHECKMARK")
+        row_op(self, OpExportTimings)
+        row_op(self, OpResetTimings)
+
+
+depsgraph_handlers = (
+    live_cost_depsgraph_update,
+    selection_state_depsgraph_update,
+    selection_bounds_depsgraph_update,
+)
+
+load_post_handlers = (
+    live_cost_load_post,
+    selection_load_post,
+    support_load_post,
+    thickness_load_post,
+)
+
+
 blender_classes = (
     bpy.types.Operator,
     bpy.types.Panel,
-    bpy.types.PropertyGroup
+    bpy.types.PropertyGroup,
+    bpy.types.AddonPreferences
+)
+
+
+# Classes whose execute/invoke/modal/draw calls are timed
+timed_classes = (
+    bpy.types.Operator,
+    bpy.types.Panel,
 )
 
 
 def auto_register_unregister_classes(classes_to_check, register=True):
     cls_members = inspect.getmembers(sys.modules[__name__], inspect.isclass)
+    # NOTE: members come sorted by name, nested PropertyGroups must sort before their users
+    if not register:
+        cls_members.reverse()
     for name, cls in cls_members:
         if any(issubclass(cls, blender_class) for blender_class in classes_to_check):
+            timed = issubclass(cls, timed_classes)
             if register:
+                if timed:
+                    profiler.instrument(cls)
                 bpy.utils.register_class(cls)
             else:
                 bpy.utils.unregister_class(cls)
+                if timed:
+                    profiler.uninstrument(cls)
 
 
 def register():
@@ -934,8 +2431,28 @@ def register():
     bpy.types.Scene.cost_monitor = bpy.props.PointerProperty(
         type=CostMonitor)
 
+    for handler in depsgraph_handlers:
+        bpy.app.handlers.depsgraph_update_post.append(handler)
+    for handler in load_post_handlers:
+        bpy.app.handlers.load_post.append(handler)
+
+    prefs = get_preferences()
+    profiler.enabled = prefs.record_timings if prefs else True
+    if prefs and prefs.prefetch_on_register and not prefs.offline_mode:
+        prefetch_in_background()
+
 
 def unregister():
+    for handler in depsgraph_handlers:
+        if handler in bpy.app.handlers.depsgraph_update_post:
+            bpy.app.handlers.depsgraph_update_post.remove(handler)
+    for handler in load_post_handlers:
+        if handler in bpy.app.handlers.load_post:
+            bpy.app.handlers.load_post.remove(handler)
+    for timer in (refresh_live_cost, refresh_selection_state):
+        if bpy.app.timers.is_registered(timer):
+            bpy.app.timers.unregister(timer)
+
     # OP, UI
     auto_register_unregister_classes(blender_classes, register=False)
 
@@ -0,0 +1,189 @@
+import numpy as np
+from mathutils.bvhtree import BVHTree
+
+from . import geometry
+
+
+# Rays cast per ThicknessJob.step()
+RAY_CHUNK = 1024
+# Rays start this far inside the surface, relative to the bounding box diagonal,
+# so that they do not hit their own face
+RAY_OFFSET = 1e-6
+
+THICKNESS_ATTRIBUTE = "thickness"
+COLOR_ATTRIBUTE = "thickness_color"
+# Face colors: thinner than the limit, less than twice the limit, fine, not measured
+THIN_COLOR = (1.0, 0.0, 0.0, 1.0)
+WARN_COLOR = (1.0, 0.8, 0.0, 1.0)
+OK_COLOR = (1.0, 1.0, 1.0, 1.0)
+UNMEASURED_COLOR = (0.3, 0.3, 0.3, 1.0)
+# Objects whose BVH tree is kept, least recently used go first
+SHELL_CACHE_SIZE = 4
+
+
+def face_arrays(me, matrix):
+    """World space face centers, unit normals and areas of a mesh."""
+    count = len(me.polygons)
+    centers = np.empty(count * 3, dtype=np.float32)
+    me.polygons.foreach_get("center", centers)
+    normals = np.empty(count * 3, dtype=np.float32)
+    me.polygons.foreach_get("normal", normals)
+    areas = np.empty(count, dtype=np.float32)
+    me.polygons.foreach_get("area", areas)
+
+    m = geometry.matrix_to_array(matrix)[:3, :3]
+    # Area vectors transform with the cofactor matrix
+    cofactor = np.linalg.det(m) * np.linalg.inv(m).T
+    area_vectors = (normals.reshape(-1, 3).astype(np.float64) * areas[:, None]) @ cofactor.T
+    world_areas = np.linalg.norm(area_vectors, axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        world_normals = np.nan_to_num(area_vectors / world_areas[:, None])
+
+    world_centers = geometry.transform_points(centers.reshape(-1, 3).astype(np.float64), matrix)
+    return world_centers, world_normals, world_areas
+
+
+class Shell:
+    """BVH tree of an object in world space plus the frame of each face."""
+
+    def __init__(self, bm, centers, normals, areas):
+        self.tree = BVHTree.FromBMesh(bm)
+        self.centers = centers
+        self.normals = normals
+        self.areas = areas
+        diagonal = np.linalg.norm(centers.max(axis=0) - centers.min(axis=0)) if len(centers) else 1.0
+        self.offset = max(diagonal * RAY_OFFSET, 1e-9)
+
+
+class ShellCache:
+    # One Shell per object, kept while the evaluated mesh and the transform stay
+    # the same, for the ``size`` most recently analysed objects
+
+    def __init__(self, size=SHELL_CACHE_SIZE):
+        self.size = size
+        self._entries = {}
+
+    def get(self, obj, depsgraph, copy_bmesh):
+        """Shell of ``obj``, ``copy_bmesh(obj)`` makes the world space bmesh for a new tree."""
+        with geometry.evaluated_mesh(obj, depsgraph) as me:
+            key = (geometry.mesh_fingerprint(me), tuple(v for row in obj.matrix_world for v in row))
+            entry = self._entries.pop(obj.name, None)
+            if entry is not None and entry[0] == key:
+                self._entries[obj.name] = entry
+                return entry[1]
+            # NOTE: the outdated tree is dropped before the new one is built
+            del entry
+            centers, normals, areas = face_arrays(me, obj.matrix_world)
+
+        bm = copy_bmesh(obj)
+        try:
+            shell = Shell(bm, centers, normals, areas)
+        finally:
+            bm.free()
+        self._entries[obj.name] = (key, shell)
+        while len(self._entries) > self.size:
+            del self._entries[next(iter(self._entries))]
+        return shell
+
+    def clear(self):
+        self._entries = {}
+
+
+class ThicknessJob:
+    """Casts one ray per sampled face inward along its normal, a chunk per step().
+
+    The distance to the first hit is the wall thickness at that face. Faces
+    without a hit within ``max_distance`` count as ``max_distance`` thick.
+    """
+
+    def __init__(self, shell, max_distance, max_samples=0, seed=0):
+        self.shell = shell
+        self.max_distance = max_distance
+        face_count = len(shell.centers)
+        if max_samples and face_count > max_samples:
+            rng = np.random.default_rng(seed)
+            self.faces = np.sort(rng.choice(face_count, max_samples, replace=False))
+        else:
+            self.faces = np.arange(face_count)
+
+        self.thickness = np.full(len(self.faces), max_distance)
+        self.done = 0
+
+    @property
+    def finished(self):
+        return self.done >= len(self.faces)
+
+    @property
+    def fraction(self):
+        return self.done / len(self.faces) if len(self.faces) else 1.0
+
+    def step(self, count=RAY_CHUNK):
+        """Cast the next ``count`` rays, returns True once all rays are done."""
+        end = min(self.done + count, len(self.faces))
+        faces = self.faces[self.done:end]
+        directions = -self.shell.normals[faces]
+        origins = (self.shell.centers[faces] + directions * self.shell.offset).tolist()
+
+        ray_cast = self.shell.tree.ray_cast
+        distances = self.thickness
+        for k, origin, direction in zip(range(self.done, end), origins, directions.tolist()):
+            location, normal, index, distance = ray_cast(origin, direction, self.max_distance)
+            if location is not None:
+                distances[k] = distance + self.shell.offset
+
+        self.done = end
+        return self.finished
+
+    def summary(self, min_thickness):
+        measured = self.thickness[:self.done]
+        areas = self.shell.areas[self.faces[:self.done]]
+        thin = measured < min_thickness
+        total_area = areas.sum()
+        return {
+            "faces": len(self.shell.centers),
+            "samples": int(self.done),
+            "thin": int(thin.sum()),
+            # Sampled faces stand for the whole surface in proportion to their area
+            "thin_area_fraction": float(areas[thin].sum() / total_area) if total_area > 0.0 else 0.0,
+            "min": float(measured.min()) if len(measured) else None,
+            "median": float(np.median(measured)) if len(measured) else None,
+        }
+
+    def face_values(self):
+        # Thickness per face, -1 for faces that were not sampled
+        values = np.full(len(self.shell.centers), -1.0, dtype=np.float32)
+        values[self.faces[:self.done]] = self.thickness[:self.done]
+        return values
+
+
+def face_colors(values, min_thickness):
+    colors = np.empty((len(values), 4), dtype=np.float32)
+    colors[:] = OK_COLOR
+    colors[values < min_thickness * 2.0] = WARN_COLOR
+    colors[values < min_thickness] = THIN_COLOR
+    colors[values < 0.0] = UNMEASURED_COLOR
+    return colors
+
+
+def write_attributes(me, values, min_thickness):
+    """Store the thickness as a face attribute and a color attribute for the viewport."""
+    attribute = me.attributes.get(THICKNESS_ATTRIBUTE)
+    if attribute is not None and (attribute.domain != 'FACE' or attribute.data_type != 'FLOAT'):
+        me.attributes.remove(attribute)
+        attribute = None
+    if attribute is None:
+        attribute = me.attributes.new(THICKNESS_ATTRIBUTE, 'FLOAT', 'FACE')
+    attribute.data.foreach_set("value", values)
+
+    # NOTE: color attributes only live on points or corners, each face color goes to its corners
+    color = me.color_attributes.get(COLOR_ATTRIBUTE)
+    if color is not None and color.domain != 'CORNER':
+        me.color_attributes.remove(color)
+        color = None
+    if color is None:
+        color = me.color_attributes.new(COLOR_ATTRIBUTE, 'BYTE_COLOR', 'CORNER')
+    loop_total = np.empty(len(me.polygons), dtype=np.int32)
+    me.polygons.foreach_get("loop_total", loop_total)
+    color.data.foreach_set("color", np.repeat(face_colors(values, min_thickness), loop_total, axis=0).reshape(-1))
+    me.color_attributes.active_color = color
+    me.update()
@@ -0,0 +1,160 @@
+import http.client
+import random
+import ssl
+import threading
+import time
+import urllib.parse
+
+
+# Statuses worth another try, everything else is handed to the caller
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+class TransportError(OSError):
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+def create_ssl_context(verify=True):
+    if not verify:
+        # NOTE: WARNING it will not verify cert
+        return ssl._create_unverified_context()
+
+    try:
+        # Blender ships certifi, the system store may be missing on Windows
+        import certifi
+        return ssl.create_default_context(cafile=certifi.where())
+    except ImportError:
+        return ssl.create_default_context()
+
+
+class Response:
+    """A response whose connection goes back to the pool once it is closed."""
+
+    def __init__(self, transport, key, conn, response):
+        self._transport = transport
+        self._key = key
+        self._conn = conn
+        self._response = response
+
+        self.status = response.status
+        self.headers = response.headers
+
+    def read(self, amt=None):
+        try:
+            return self._response.read(amt)
+        except (http.client.HTTPException, OSError) as e:
+            self._conn.close()
+            raise TransportError(f"Connection lost while reading: {e}") from e
+
+    def close(self):
+        if self._conn is None:
+            return
+        if self._response.isclosed() and not self._response.will_close:
+            self._transport._release(self._key, self._conn)
+        else:
+            # Unread body or server asked to close, the connection is not reusable
+            self._response.close()
+            self._conn.close()
+        self._conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Transport:
+    """Keep-alive connection pool per host with jittered retries."""
+
+    def __init__(self, timeout=30.0, retries=3, backoff=0.5, max_backoff=8.0, verify=True, max_idle_per_host=4):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.verify = verify
+        self.max_idle_per_host = max_idle_per_host
+
+        self._lock = threading.Lock()
+        self._idle = {}
+        self._ssl_context = None
+        self._ssl_verify = None
+
+    def request(self, method, url, headers=None):
+        """Send ``method url`` and return a Response, retrying transient failures.
+
+        The caller must close the response (or use it as a context manager).
+        """
+        parts = urllib.parse.urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port)
+        target = parts.path or "/"
+        if parts.query:
+            target += "?" + parts.query
+
+        attempt = 0
+        while True:
+            conn, reused = self._acquire(key)
+            try:
+                conn.request(method, target, headers=headers or {})
+                response = conn.getresponse()
+            except (http.client.HTTPException, OSError) as e:
+                conn.close()
+                if reused:
+                    # NOTE: idle keep-alive connections may have been dropped by the server
+                    continue
+                if attempt >= self.retries:
+                    raise TransportError(f"{method} {url} failed: {e}") from e
+            else:
+                if response.status not in RETRY_STATUSES or attempt >= self.retries:
+                    return Response(self, key, conn, response)
+                retry_after = response.headers.get("Retry-After")
+                response.read()
+                if response.will_close:
+                    conn.close()
+                else:
+                    self._release(key, conn)
+                if retry_after and retry_after.isdigit():
+                    time.sleep(min(float(retry_after), self.max_backoff))
+                    attempt += 1
+                    continue
+
+            time.sleep(random.uniform(0.0, min(self.max_backoff, self.backoff * (2 ** attempt))))
+            attempt += 1
+
+    def close(self):
+        with self._lock:
+            for connections in self._idle.values():
+                for conn in connections:
+                    conn.close()
+            self._idle = {}
+
+    def _get_ssl_context(self):
+        if self._ssl_context is None or self._ssl_verify != self.verify:
+            self._ssl_context = create_ssl_context(self.verify)
+            self._ssl_verify = self.verify
+        return self._ssl_context
+
+    def _acquire(self, key):
+        with self._lock:
+            connections = self._idle.get(key)
+            if connections:
+                return connections.pop(), True
+
+        scheme, host, port = key
+        if scheme == "https":
+            conn = http.client.HTTPSConnection(host, port, timeout=self.timeout, context=self._get_ssl_context())
+        elif scheme == "http":
+            conn = http.client.HTTPConnection(host, port, timeout=self.timeout)
+        else:
+            raise TransportError(f"Unsupported scheme {scheme}")
+        return conn, False
+
+    def _release(self, key, conn):
+        with self._lock:
+            connections = self._idle.setdefault(key, [])
+            if len(connections) < self.max_idle_per_host:
+                connections.append(conn)
+                return
+        conn.close()